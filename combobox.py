@@ -14,6 +14,11 @@ except ImportError:
 class HeaderComboBox(QWidget):
     """HeaderComboBox class
     ComboBox with header label. This is useful when you layout the pairs out label and comboBox.
+    largeVocabulary=Trueの場合は、数万件のアイテムを扱うためにQStringListModelをモデルとして使い、
+    ポップアップは一定件数ずつ配置する。サイズの計算で全アイテムを計測しない。
+    setModelで任意のモデルを渡すこともできる。
+    アイテムのテキストから行番号への辞書（大文字小文字を区別するものとしないもの）を持ち、
+    入力されたテキストの判定、完全一致のfindText、setCurrentTextは辞書を引くだけで行う。
     """
 
     #---------------------------------------------------------------------------
@@ -23,17 +28,26 @@ class HeaderComboBox(QWidget):
     editTextChanged = Signal(unicode)
     highlighted = Signal(int)
 
+    LARGE_VOCABULARY_BATCH_SIZE = 200
+    LARGE_VOCABULARY_CONTENTS_LENGTH = 20
+
 
     #---------------------------------------------------------------------------
     ## コンストラクタ。ヘッダーとアイテムを指定できる。
     # @param header (str) : [= ""]
     # @param items (list) : [= []] list of strings
     # @param parent (QWidget) : [= None]
+    # @param largeVocabulary (bool) : [= False] 大量のアイテムを扱うかどうか
     # @return None
-    def __init__(self, header = "", items = [], parent = None):
+    def __init__(self, header = "", items = [], parent = None, largeVocabulary = False):
         super(HeaderComboBox, self).__init__(parent)
         self._header = header
-        self._items = items
+        self._items = list(items)
+        self._textIndex = None
+        self._foldedTextIndex = None
+        self._largeVocabulary = largeVocabulary
+        self._itemsModel = None
+        self._sourceModel = None
         self._prevIdx = 0
         self._initUI()
         self._setSignals()
@@ -52,14 +66,34 @@ class HeaderComboBox(QWidget):
 
         self.mainCombo = QComboBox()
         self.mainCombo.setEditable(True)
-        self.mainCombo.addItems(self._items)
-        self.mainCombo.setSizeAdjustPolicy(QComboBox.AdjustToContentsOnFirstShow)
+        if self._largeVocabulary:
+            self._itemsModel = QStringListModel(self._items, self)
+            self._setLargeVocabularyModel(self._itemsModel)
+        else:
+            self.mainCombo.addItems(self._items)
+            self.mainCombo.setSizeAdjustPolicy(QComboBox.AdjustToContentsOnFirstShow)
         self.mainCombo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Maximum)
         self.mainCombo.completer().setCompletionMode(QCompleter.PopupCompletion)
         self.mainLayout.addWidget(self.mainCombo)
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
 
 
+    #---------------------------------------------------------------------------
+    ## 大量のアイテム用の設定でモデルをセットするメソッド(隠蔽)。ポップアップはアイテムの高さを揃えて
+    # LARGE_VOCABULARY_BATCH_SIZE件ずつ配置し、幅はLARGE_VOCABULARY_CONTENTS_LENGTH文字分にする。
+    # @param model (QAbstractItemModel)
+    # @return None
+    def _setLargeVocabularyModel(self, model):
+        view = QListView()
+        view.setUniformItemSizes(True)
+        view.setLayoutMode(QListView.Batched)
+        view.setBatchSize(self.LARGE_VOCABULARY_BATCH_SIZE)
+        self.mainCombo.setView(view)
+        self.mainCombo.setModel(model)
+        self.mainCombo.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLength)
+        self.mainCombo.setMinimumContentsLength(self.LARGE_VOCABULARY_CONTENTS_LENGTH)
+
+
     #---------------------------------------------------------------------------
     ## シグナル設定メソッド(隠蔽)
     # @return None
@@ -76,8 +110,10 @@ class HeaderComboBox(QWidget):
     # @return None
     def _activatedEvent(self, idx):
         text = self.mainCombo.itemText(idx)
-        if text not in self._items:
+        if not self.hasItem(text):
             self.mainCombo.removeItem(idx)
+            if idx != self.mainCombo.count():
+                self._invalidateTextIndex()
             self.mainCombo.setCurrentIndex(self._prevIdx)
             self.activated.emit(self._prevIdx)
 
@@ -88,10 +124,127 @@ class HeaderComboBox(QWidget):
 
 
     #---------------------------------------------------------------------------
-    ## コンボボックスのアイテムを全部削除するメソッド
+    ## アイテムに指定したテキストがあるかどうかを返すメソッド。
+    # @param text (unicode) : 文字列
+    # @return bool
+    def hasItem(self, text):
+        return self._itemTextIndex()[0].has_key(text)
+
+
+    #---------------------------------------------------------------------------
+    ## テキストから行番号への辞書を返すメソッド(隠蔽)。無い場合はアイテムのリスト、
+    # setModelで渡されたモデルから作り直す。同じテキストが複数ある場合は最初の行番号を持つ。
+    # @return textIndex (tuple) : (テキストの辞書, 小文字化したテキストの辞書)
+    def _itemTextIndex(self):
+        if self._textIndex is None:
+            if self._sourceModel is None:
+                texts = self._items
+            else:
+                model = self._sourceModel
+                column = self.mainCombo.modelColumn()
+                texts = [model.data(model.index(row, column), Qt.DisplayRole)
+                         for row in range(model.rowCount())]
+
+            self._textIndex = {}
+            self._foldedTextIndex = {}
+            for row, text in enumerate(texts):
+                self._addTextIndex(row, text)
+
+        return self._textIndex, self._foldedTextIndex
+
+
+    def _addTextIndex(self, row, text):
+        if text is None:
+            return
+        self._textIndex.setdefault(text, row)
+        self._foldedTextIndex.setdefault(text.lower(), row)
+
+
+    def _invalidateTextIndex(self):
+        self._textIndex = None
+        self._foldedTextIndex = None
+
+
+    #---------------------------------------------------------------------------
+    ## コンボボックスのアイテムを全部削除するメソッド。setModelでモデルを渡していた場合は
+    # そのモデルの行は削除せず、接続を外して空のモデルに入れ替える。
     # @return None
     def clearItems(self):
-        self.mainCombo.clear()
+        if self._sourceModel is not None:
+            self._releaseSourceModel()
+            self._itemsModel.setStringList([])
+        else:
+            self.mainCombo.clear()
+        self._items = []
+        self._invalidateTextIndex()
+
+
+    #---------------------------------------------------------------------------
+    ## アイテムを一つ末尾に追加するメソッド。テキストの辞書は作り直さずに追加する。
+    # setModelでモデルを渡している場合は使えない。
+    # @param text (str) : アイテムのテキスト
+    # @return None
+    def addItem(self, text):
+        if self._sourceModel is not None:
+            raise RuntimeError("addItem cannot be used with a model set by setModel.")
+
+        row = len(self._items)
+        self._items.append(text)
+        self.mainCombo.insertItem(row, text)
+        if self._textIndex is not None:
+            self._addTextIndex(row, text)
+
+
+    #---------------------------------------------------------------------------
+    ## コンボボックスのモデルをセットするメソッド。大量のアイテム用の設定が使われる。
+    # アイテムの判定用のセットは、モデルが変更された後の最初の判定時に作り直す。
+    # 渡されたモデルは変更しないため、アイテムに無いテキストが入力されても追加はされない。
+    # @param model (QAbstractItemModel)
+    # @return None
+    def setModel(self, model):
+        self._connectSourceModel(False)
+        self._sourceModel = model
+        self._items = []
+        self._invalidateTextIndex()
+        self._largeVocabulary = True
+        self._setLargeVocabularyModel(model)
+        self.mainCombo.setInsertPolicy(QComboBox.NoInsert)
+        self._connectSourceModel(True)
+        self._prevIdx = self.mainCombo.currentIndex()
+
+
+    def model(self):
+        return self.mainCombo.model()
+
+
+    #---------------------------------------------------------------------------
+    ## setModelで渡されたモデルの接続を外し、大量のアイテム用のモデルに戻すメソッド(隠蔽)。
+    # 渡されたモデルの中身は変更しない。
+    # @return None
+    def _releaseSourceModel(self):
+        self._connectSourceModel(False)
+        self._sourceModel = None
+        if self._itemsModel is None:
+            self._itemsModel = QStringListModel(self)
+        self.mainCombo.setModel(self._itemsModel)
+        self.mainCombo.setInsertPolicy(QComboBox.InsertAtBottom)
+
+
+    def _connectSourceModel(self, connect):
+        model = self._sourceModel
+        if model is None:
+            return
+        signals = (model.modelReset, model.layoutChanged, model.rowsInserted,
+                   model.rowsRemoved, model.dataChanged)
+        for signal in signals:
+            if connect:
+                signal.connect(self._sourceModelChanged)
+            else:
+                signal.disconnect(self._sourceModelChanged)
+
+
+    def _sourceModelChanged(self, *args):
+        self._invalidateTextIndex()
 
 
     #---------------------------------------------------------------------------
@@ -137,7 +290,7 @@ class HeaderComboBox(QWidget):
     # @param text (str) : コンボボックスのアイテムテキスト
     # @return None
     def setCurrentText(self, text):
-        idx = self.mainCombo.findText(text)
+        idx = self.findText(text)
         if idx > -1:
             self.mainCombo.setCurrentIndex(idx)
         else:
@@ -175,14 +328,24 @@ class HeaderComboBox(QWidget):
 
 
     #---------------------------------------------------------------------------
-    ## アイテムを設定するメソッド。
+    ## アイテムを設定するメソッド。大量のアイテム用の設定の場合はモデルの文字列リストを入れ替える。
+    # setModelでモデルを渡していた場合は、大量のアイテム用のモデルに戻す。
     # @param items (list) : 文字列のリスト
     # @return None
     def setItems(self, items):
-        self._items = items
+        self._items = list(items)
+        self._invalidateTextIndex()
         self.mainCombo.blockSignals(True)
-        self.mainCombo.clear()
-        self.mainCombo.addItems(self._items)
+        if self._largeVocabulary:
+            if self._sourceModel is not None:
+                self._releaseSourceModel()
+            elif self._itemsModel is None:
+                self._itemsModel = QStringListModel(self)
+                self.mainCombo.setModel(self._itemsModel)
+            self._itemsModel.setStringList(self._items)
+        else:
+            self.mainCombo.clear()
+            self.mainCombo.addItems(self._items)
         self.mainCombo.blockSignals(False)
         self.mainCombo.setCurrentIndex(0)
         self.mainCombo.currentIndexChanged.emit(0)
@@ -190,10 +353,19 @@ class HeaderComboBox(QWidget):
 
     #---------------------------------------------------------------------------
     ## アイテムの中に指定したテキストがあるかどうかを調べるメソッド。見つからない場合は-1が返る。
+    # Qt.MatchExactly、Qt.MatchFixedStringはテキストの辞書を引き、それ以外はQComboBox.findTextで調べる。
     # @param text (unicode) : 文字列
     # @param flags (Qt.MatchFlag)
     # @return int
     def findText(self, text, flags = Qt.MatchExactly | Qt.MatchCaseSensitive):
+        matchType = int(flags) & 0x0F
+        if matchType == Qt.MatchExactly or\
+           (matchType == Qt.MatchFixedString and int(flags) & Qt.MatchCaseSensitive):
+            return self._itemTextIndex()[0].get(text, -1)
+
+        if matchType == Qt.MatchFixedString:
+            return self._itemTextIndex()[1].get(text.lower(), -1)
+
         return self.mainCombo.findText(text, flags)
 
 
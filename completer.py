@@ -9,45 +9,1223 @@ except ImportError:
     from PySide.QtGui import *
     from PySide.QtCore import *
 
+import heapq
+import re
+from collections import OrderedDict
+
+
+#-------------------------------------------------------------------------------
+## 古い文字列リストを新しい文字列リストに合わせるための、削除と挿入の手順を返す関数。
+# 残る文字列（重複は新しいリストの個数まで）の順番が変わっていない場合のみ手順を作る。
+# 削除は古いリストの行番号で後ろから、挿入は新しいリストの行番号で前から順に行う。
+# @param old (list) : 古い文字列リスト
+# @param items (list) : 新しい文字列リスト
+# @return ops (list) : ("remove", 行番号, 行数)、("insert", 行番号, 文字列リスト)のタプルのリスト。
+# 残る文字列の順番が変わっている場合はNone
+def _diffStringLists(old, items):
+    counts = {}
+    for item in items:
+        counts[item] = counts.get(item, 0) + 1
+
+    kept = []
+    removedRows = []
+    for row, item in enumerate(old):
+        if counts.get(item, 0) > 0:
+            counts[item] -= 1
+            kept.append(item)
+        else:
+            removedRows.append(row)
+
+    insertRows = []
+    j = 0
+    for row, item in enumerate(items):
+        if j < len(kept) and kept[j] == item:
+            j += 1
+        else:
+            insertRows.append(row)
+
+    if j != len(kept):
+        return None
+
+    ops = []
+    for start, count in reversed(_rowBlocks(removedRows)):
+        ops.append(("remove", start, count))
+    for start, count in _rowBlocks(insertRows):
+        ops.append(("insert", start, items[start:start + count]))
+    return ops
+
+
+#-------------------------------------------------------------------------------
+## 昇順の行番号のリストを連続した塊にまとめる関数。
+# @param rows (list) : 昇順の行番号のリスト
+# @return blocks (list) : (先頭の行番号, 行数)のタプルのリスト
+def _rowBlocks(rows):
+    blocks = []
+    for row in rows:
+        if len(blocks) > 0 and blocks[-1][0] + blocks[-1][1] == row:
+            blocks[-1] = (blocks[-1][0], blocks[-1][1] + 1)
+        else:
+            blocks.append((row, 1))
+    return blocks
+
+
+#-------------------------------------------------------------------------------
+## QStringListModelの中身を新しい文字列リストに合わせる関数。全体を作り直さず、無くなった行の削除と
+# 増えた行の挿入だけを行う。残った行の順番が変わっている場合のみsetStringListで作り直す。
+# @param model (QStringListModel) : 更新するモデル
+# @param items (list) : list of strings
+# @return changed (int) : 削除、挿入した行数。作り直した場合は新しい行数
+def updateStringListModel(model, items):
+    items = list(items)
+    ops = _diffStringLists(model.stringList(), items)
+    if ops is None:
+        model.setStringList(items)
+        return len(items)
+
+    changed = 0
+    for op, row, value in ops:
+        if op == "remove":
+            model.removeRows(row, value)
+            changed += value
+        else:
+            model.insertRows(row, len(value))
+            for i, item in enumerate(value):
+                model.setData(model.index(row + i, 0), item)
+            changed += len(value)
+
+    return changed
+
+
+
+class CompletionIndex(object):
+    """CompletionIndex class
+    補完候補の文字列から小文字化したキーとn-gramの索引を一度だけ作り、部分一致の検索を行うクラス。
+    NGRAM文字以上の検索文字列は、含まれるn-gramのうち最も候補の少ないものの行だけを調べるため、
+    候補全体を走査しない。NGRAM文字未満の場合は小文字化済みのキーを走査する。
+    fuzzySearchは検索文字列の文字を順に含む（間に他の文字があってもよい）候補を返し、rankで
+    先頭一致、単語の先頭、連続した一致を高く評価した上位の候補だけを取り出す。
+    候補は追加順の番号（インデックス）で索引に登録され、表示順は別に番号のリストで持つ。
+    insertItems、removeRows、updateItemsで途中への挿入や削除をしても、索引は追加、削除された候補の分だけを
+    更新する。削除された候補は空文字にして検索結果から除き、半分以上が削除された時点で索引を作り直す。
+    """
+
+    NGRAM = 3
+    WORD_SEPARATORS = " _-./:|"
+    SCORE_MATCH = 1
+    SCORE_CONSECUTIVE = 5
+    SCORE_WORD_START = 8
+    SCORE_PREFIX = 15
+    SCORE_GAP = -1
+
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param items (list) : [= []] list of strings
+    # @return None
+    def __init__(self, items = []):
+        self.setItems(items)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の文字列をセットして索引を作り直すメソッド。
+    # @param items (list) : list of strings
+    # @return None
+    def setItems(self, items):
+        self._items = []
+        self._keys = []
+        self._grams = {}
+        self._chars = {}
+        self._positions = {}
+        self._removed = set()
+        self._order = []
+        self._ordered = True
+        self._ranks = None
+        self.appendItems(items)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の文字列を末尾に追加するメソッド。追加した分だけ索引に加える。
+    # @param items (list) : list of strings
+    # @return None
+    def appendItems(self, items):
+        self.insertItems(len(self._order), items)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の文字列を指定した行に挿入するメソッド。追加した分だけ索引に加える。
+    # @param row (int) : 挿入する行
+    # @param items (list) : list of strings
+    # @return None
+    def insertItems(self, row, items):
+        indices = [self._addItem(item) for item in items]
+        if len(indices) == 0:
+            return
+        if row < len(self._order):
+            self._ordered = False
+        self._order[row:row] = indices
+        self._ranks = None
+
+
+    #---------------------------------------------------------------------------
+    ## 指定した行から候補を削除するメソッド。
+    # @param row (int) : 先頭の行
+    # @param count (int) : 行数
+    # @return None
+    def removeRows(self, row, count):
+        for i in self._order[row:row + count]:
+            self._removeItem(i)
+        del self._order[row:row + count]
+        self._ranks = None
+        self._compact()
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を新しい文字列リストに合わせるメソッド。残る候補の順番が変わっていない場合は、
+    # 無くなった候補の削除と増えた候補の挿入（途中への挿入も含む）だけで索引を更新する。
+    # 順番が変わっている場合はreorderItemsで、残る候補の索引を使い回して並べ直す。
+    # どちらの場合も候補はitemsと同じ順番、同じ重複になる。
+    # @param items (list) : list of strings
+    # @return count (int) : 削除、挿入した候補の数。並べ直した場合は新しい候補の数
+    def updateItems(self, items):
+        items = list(items)
+        ops = _diffStringLists(self.items(), items)
+        if ops is None:
+            return self.reorderItems(items)
+
+        count = 0
+        for op, row, value in ops:
+            if op == "remove":
+                self.removeRows(row, value)
+                count += value
+            else:
+                self.insertItems(row, value)
+                count += len(value)
+
+        return count
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を新しい文字列リストの順番に並べ直すメソッド。同じ文字列の候補は索引をそのまま使い、
+    # 増えた文字列だけを索引に加え、無くなった文字列だけを削除する。
+    # @param items (list) : list of strings
+    # @return count (int) : 新しい候補の数
+    def reorderItems(self, items):
+        available = dict([(item, list(reversed(indices))) for item, indices in self._positions.items()])
+        order = []
+        for item in items:
+            indices = available.get(item)
+            if indices:
+                order.append(indices.pop())
+            else:
+                order.append(self._addItem(item))
+
+        for indices in available.values():
+            for i in indices:
+                self._removeItem(i)
+
+        self._order = order
+        self._ordered = all(order[j] < order[j + 1] for j in range(len(order) - 1))
+        self._ranks = None
+        self._compact()
+        return len(order)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の文字列を削除するメソッド。同じ文字列が複数ある場合は全て削除する。
+    # @param items (list) : list of strings
+    # @return count (int) : 削除した候補の数
+    def removeItems(self, items):
+        count = 0
+        for item in items:
+            for i in list(self._positions.get(item, [])):
+                self._removeItem(i)
+                count += 1
+
+        if count > 0:
+            removed = self._removed
+            self._order = [i for i in self._order if i not in removed]
+            self._ranks = None
+            self._compact()
+
+        return count
+
+
+    #---------------------------------------------------------------------------
+    ## 指定した文字列の候補がある行のリストを返すメソッド。
+    # @param items (list) : list of strings
+    # @return rows (list) : 行のリスト。昇順に並んでいる。
+    def rowsOf(self, items):
+        ranks = self._rankList()
+        rows = []
+        for item in set(items):
+            rows.extend([ranks[i] for i in self._positions.get(item, [])])
+        return sorted(rows)
+
+
+    def _addItem(self, item):
+        i = len(self._items)
+        key = item.lower()
+        self._items.append(item)
+        self._keys.append(key)
+        self._positions.setdefault(item, []).append(i)
+        self._addGrams(i, key)
+        return i
+
+
+    def _removeItem(self, i):
+        item = self._items[i]
+        positions = self._positions[item]
+        positions.remove(i)
+        if len(positions) == 0:
+            del self._positions[item]
+        self._items[i] = ""
+        self._keys[i] = ""
+        self._removed.add(i)
+
+
+    #---------------------------------------------------------------------------
+    ## 半分以上の候補が削除されている場合に、残っている候補で索引を作り直すメソッド(隠蔽)。
+    # 候補の行は変わらない。
+    # @return None
+    def _compact(self):
+        if len(self._removed) * 2 > len(self._items):
+            self.setItems(self.items())
+
+
+    def _addGrams(self, i, key):
+        n = self.NGRAM
+        for gram in set([key[j:j + n] for j in range(len(key) - n + 1)]):
+            self._grams.setdefault(gram, []).append(i)
+        for char in set(key):
+            self._chars.setdefault(char, []).append(i)
+
+
+    #---------------------------------------------------------------------------
+    ## 文字列を部分一致で検索するメソッド。
+    # @param text (str) : 検索文字列
+    # @param caseSensitive (bool) : [= False] 大文字小文字を区別するかどうか
+    # @param candidates (list) : [= None] 調べる候補のインデックス。前回の結果を渡すと、その中だけを調べる。
+    # 索引から得られる候補の方が少ない場合はそちらを使う。
+    # @return matches (list) : 一致した候補のインデックスのリスト。候補の順に並んでいる。
+    def search(self, text, caseSensitive = False, candidates = None):
+        key = text.lower()
+        keys = self._keys
+        indexCandidates = self._candidates(key)
+        if candidates is None or len(indexCandidates) < len(candidates):
+            candidates = indexCandidates
+        matches = [i for i in candidates if key in keys[i]]
+
+        if caseSensitive:
+            items = self._items
+            matches = [i for i in matches if text in items[i]]
+
+        return self._inOrder(matches)
+
+
+    #---------------------------------------------------------------------------
+    ## 削除された候補を除き、インデックスのリストを候補の順に並べるメソッド(隠蔽)。
+    # 途中に挿入された候補が無ければインデックスの順が候補の順なので並べ替えない。
+    # @param matches (list) : 候補のインデックスのリスト
+    # @return matches (list)
+    def _inOrder(self, matches):
+        if len(self._removed) > 0:
+            removed = self._removed
+            matches = [i for i in matches if i not in removed]
+        if self._ordered:
+            return matches
+        return sorted(matches, key = self._rankList().__getitem__)
+
+
+    #---------------------------------------------------------------------------
+    ## インデックスから行を引くリストを返すメソッド(隠蔽)。候補の順が変わるまで使い回す。
+    # @return ranks (list) : インデックスの位置に行を持つリスト。削除された候補は-1
+    def _rankList(self):
+        if self._ranks is None:
+            ranks = [-1] * len(self._items)
+            for row, i in enumerate(self._order):
+                ranks[i] = row
+            self._ranks = ranks
+        return self._ranks
+
+
+    #---------------------------------------------------------------------------
+    ## 検索文字列を含む可能性のある候補のインデックスを返すメソッド(隠蔽)。
+    # @param key (str) : 小文字化した検索文字列
+    # @return candidates (list) : 候補のインデックスのリスト
+    def _candidates(self, key):
+        n = self.NGRAM
+        if len(key) < n:
+            return self._order
+
+        candidates = None
+        for j in range(len(key) - n + 1):
+            posting = self._grams.get(key[j:j + n])
+            if posting is None:
+                return []
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+
+        return candidates
+
+
+    #---------------------------------------------------------------------------
+    ## 検索文字列の文字を順に含む候補を検索するメソッド。
+    # @param text (str) : 検索文字列
+    # @param caseSensitive (bool) : [= False] 大文字小文字を区別するかどうか
+    # @param candidates (list) : [= None] 調べる候補のインデックス。前回の結果を渡すと、その中だけを調べる。
+    # @return matches (list) : 一致した候補のインデックスのリスト。候補の順に並んでいる。
+    def fuzzySearch(self, text, caseSensitive = False, candidates = None):
+        key = text.lower()
+        keys = self._keys
+        indexCandidates = self._charCandidates(key)
+        if candidates is None or len(indexCandidates) < len(candidates):
+            candidates = indexCandidates
+
+        pattern = re.compile(".*?".join([re.escape(char) for char in key]))
+        matches = [i for i in candidates if pattern.search(keys[i])]
+
+        if caseSensitive:
+            items = self._items
+            pattern = re.compile(".*?".join([re.escape(char) for char in text]))
+            matches = [i for i in matches if pattern.search(items[i])]
+
+        return self._inOrder(matches)
+
+
+    def _charCandidates(self, key):
+        candidates = None
+        for char in set(key):
+            posting = self._chars.get(char)
+            if posting is None:
+                return []
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+
+        if candidates is None:
+            return self._order
+        return candidates
+
+
+    #---------------------------------------------------------------------------
+    ## fuzzySearchの結果を評価の高い順に並べ、上位limit個を返すメソッド。
+    # 全体を並べ替えず、limit個のヒープで上位だけを選ぶ。同点の場合は候補の順。
+    # @param text (str) : 検索文字列
+    # @param matches (list) : 候補のインデックスのリスト
+    # @param limit (int) : 返す候補の数
+    # @return matches (list) : 候補のインデックスのリスト
+    def rank(self, text, matches, limit):
+        key = text.lower()
+        return heapq.nlargest(limit, matches, key = lambda i: self._fuzzyScore(key, i))
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の評価を計算するメソッド(隠蔽)。部分一致する場合はその位置、しない場合は前から順に
+    # 文字を当てはめた位置で評価し、高い方を使う。
+    # @param key (str) : 小文字化した検索文字列
+    # @param i (int) : 候補のインデックス
+    # @return score (int)
+    def _fuzzyScore(self, key, i):
+        target = self._keys[i]
+        positions = []
+        start = 0
+        for char in key:
+            start = target.find(char, start)
+            if start < 0:
+                return 0
+            positions.append(start)
+            start += 1
+
+        score = self._scorePositions(i, positions)
+        start = target.find(key)
+        if start >= 0:
+            score = max(score, self._scorePositions(i, range(start, start + len(key))))
+
+        return score
+
+
+    def _scorePositions(self, i, positions):
+        item = self._items[i]
+        score = 0
+        last = None
+        for pos in positions:
+            score += self.SCORE_MATCH
+            if pos == 0:
+                score += self.SCORE_PREFIX + self.SCORE_WORD_START
+            elif item[pos - 1] in self.WORD_SEPARATORS or\
+                 (item[pos].isupper() and item[pos - 1].islower()):
+                score += self.SCORE_WORD_START
+
+            if last is not None:
+                if pos == last + 1:
+                    score += self.SCORE_CONSECUTIVE
+                else:
+                    score += self.SCORE_GAP * (pos - last - 1)
+            last = pos
+
+        return score
+
+
+    #---------------------------------------------------------------------------
+    ## インデックスのリストから候補の文字列のリストを返すメソッド。
+    # @param indices (list) : 候補のインデックスのリスト
+    # @return items (list) : list of strings
+    def items(self, indices = None):
+        if indices is None:
+            indices = self._order
+        return [self._items[i] for i in indices]
+
+
+    #---------------------------------------------------------------------------
+    ## 削除されていない候補のインデックスのリストを返すメソッド。候補の順に並んでいる。
+    # @return indices (list)
+    def liveIndices(self):
+        return list(self._order)
+
+
+    def item(self, i):
+        return self._items[i]
+
+
+    #---------------------------------------------------------------------------
+    ## 行の候補の文字列を返すメソッド。
+    # @param row (int) : 行
+    # @return item (str)
+    def itemAt(self, row):
+        return self._items[self._order[row]]
+
+
+    def __len__(self):
+        return len(self._order)
+
+
+
+class CompletionCorpus(QObject):
+    """CompletionCorpus class
+    複数のコンプリータで共有する補完候補。索引(CompletionIndex)は一度だけ作られ、各コンプリータは
+    参照だけを持つ。appendItems、removeItemsで候補を増減するとchangedで通知され、各コンプリータは
+    索引を作り直さずに結果だけを取り直す。
+    候補の行の増減はrowsInserted、rowsRemoved等のシグナルでも通知され、CompletionCorpusModelは
+    リセットせずに増減した行だけを反映する。
+    attach、detachで使用しているコンプリータの数を数え、sharedで名前を付けて取得したものは
+    使用数が0になった時点で登録から外される。attachに使用するオブジェクトを渡した場合は、
+    そのオブジェクトが削除された時点で自動的にdetachされる。
+    """
+
+    #---------------------------------------------------------------------------
+    ## SIGNALS
+    changed = Signal()
+    rowsAboutToBeInserted = Signal(int, int)
+    rowsInserted = Signal(int, int)
+    rowsAboutToBeRemoved = Signal(int, int)
+    rowsRemoved = Signal(int, int)
+    modelAboutToBeReset = Signal()
+    modelReset = Signal()
+
+    _registry = {}
+
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param items (list) : [= []] list of strings
+    # @param parent (QObject) : [= None]
+    # @return None
+    def __init__(self, items = [], parent = None):
+        super(CompletionCorpus, self).__init__(parent)
+        self._index = CompletionIndex(items)
+        self._refCount = 0
+        self._owners = {}
+        self._name = None
+
+
+    #---------------------------------------------------------------------------
+    ## 名前を付けて登録された共有の候補を返すクラスメソッド。無い場合はitemsから作って登録する。
+    # @param name (str) : 登録名
+    # @param items (list) : [= []] 新しく作る場合の候補の文字列リスト
+    # @return corpus (CompletionCorpus)
+    @classmethod
+    def shared(cls, name, items = []):
+        corpus = cls._registry.get(name)
+        if corpus is None:
+            corpus = cls(items)
+            corpus._name = name
+            cls._registry[name] = corpus
+        return corpus
+
+
+    def index(self):
+        return self._index
+
+
+    def items(self):
+        return self._index.items()
+
+
+    def __len__(self):
+        return len(self._index)
+
+
+    def setItems(self, items):
+        self.modelAboutToBeReset.emit()
+        self._index.setItems(items)
+        self.modelReset.emit()
+        self.changed.emit()
+
+
+    def appendItems(self, items):
+        self.insertItems(len(self._index), items)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の文字列を指定した行に挿入するメソッド。
+    # @param row (int) : 挿入する行
+    # @param items (list) : list of strings
+    # @return None
+    def insertItems(self, row, items):
+        items = list(items)
+        if len(items) == 0:
+            return
+        self._insertRows(row, items)
+        self.changed.emit()
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を新しい文字列リストに合わせるメソッド。変わった分だけ索引を更新し、増減した行をシグナルで通知する。
+    # 残る候補の順番が変わっている場合は並べ直してリセットを通知する。
+    # @param items (list) : list of strings
+    # @return count (int) : 削除、追加した候補の数。並べ直した場合は新しい候補の数
+    def updateItems(self, items):
+        items = list(items)
+        ops = _diffStringLists(self._index.items(), items)
+        if ops is None:
+            self.modelAboutToBeReset.emit()
+            count = self._index.reorderItems(items)
+            self.modelReset.emit()
+        else:
+            count = 0
+            for op, row, value in ops:
+                if op == "remove":
+                    self._removeRows(row, value)
+                    count += value
+                else:
+                    self._insertRows(row, value)
+                    count += len(value)
+
+        if count > 0:
+            self.changed.emit()
+        return count
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の文字列を削除するメソッド。同じ文字列が複数ある場合は全て削除する。
+    # @param items (list) : list of strings
+    # @return count (int) : 削除した候補の数
+    def removeItems(self, items):
+        rows = self._index.rowsOf(items)
+        for start, count in reversed(_rowBlocks(rows)):
+            self._removeRows(start, count)
+
+        if len(rows) > 0:
+            self.changed.emit()
+        return len(rows)
+
+
+    def _insertRows(self, row, items):
+        self.rowsAboutToBeInserted.emit(row, row + len(items) - 1)
+        self._index.insertItems(row, items)
+        self.rowsInserted.emit(row, row + len(items) - 1)
+
+
+    def _removeRows(self, row, count):
+        self.rowsAboutToBeRemoved.emit(row, row + count - 1)
+        self._index.removeRows(row, count)
+        self.rowsRemoved.emit(row, row + count - 1)
+
+
+    #---------------------------------------------------------------------------
+    ## 使用するコンプリータが呼ぶメソッド。使用数を1増やす。ownerを渡した場合は、ownerのdestroyedシグナルで
+    # 自動的に使用数を減らす。
+    # @param owner (QObject) : [= None] 候補を使用するオブジェクト
+    # @return refCount (int) : 使用数
+    def attach(self, owner = None):
+        self._refCount += 1
+        if owner is not None:
+            key = id(owner)
+            slot = lambda *args: self._ownerDestroyed(key)
+            self._owners[key] = slot
+            owner.destroyed.connect(slot)
+        return self._refCount
+
+
+    #---------------------------------------------------------------------------
+    ## 使用をやめたコンプリータが呼ぶメソッド。使用数を1減らし、0になった場合は登録から外す。
+    # @param owner (QObject) : [= None] attachに渡したオブジェクト。既に自動でdetachされている場合は何もしない。
+    # @return refCount (int) : 使用数
+    def detach(self, owner = None):
+        if owner is not None:
+            slot = self._owners.pop(id(owner), None)
+            if slot is None:
+                return self._refCount
+            owner.destroyed.disconnect(slot)
+        return self._release()
+
+
+    #---------------------------------------------------------------------------
+    ## attachに渡したオブジェクトが削除された際に呼ばれるスロット(隠蔽)。
+    # @param key (int) : オブジェクトのid
+    # @return None
+    def _ownerDestroyed(self, key):
+        if self._owners.pop(key, None) is not None:
+            self._release()
+
+
+    def _release(self):
+        self._refCount = max(0, self._refCount - 1)
+        if self._refCount == 0 and self._name is not None:
+            if self._registry.get(self._name) is self:
+                del self._registry[self._name]
+            self._name = None
+        return self._refCount
+
+
+    def refCount(self):
+        return self._refCount
+
+
+
+class CompletionCorpusModel(QAbstractListModel):
+    """CompletionCorpusModel class
+    CompletionCorpusの候補を文字列を複製せずにQCompleterへ渡すためのリストモデル。
+    行は共有の候補の行をそのまま使い、候補の増減は挿入、削除された行だけを通知する。
+    使わなくなった場合はreleaseを呼ぶ。releaseを呼ばずにモデルが削除された場合も、候補の使用数は減らされる。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param corpus (CompletionCorpus) : 共有の候補
+    # @param parent (QObject) : [= None]
+    # @return None
+    def __init__(self, corpus, parent = None):
+        super(CompletionCorpusModel, self).__init__(parent)
+        self._corpus = corpus
+        corpus.attach(self)
+        self._connectCorpus(corpus, True)
+
+
+    def corpus(self):
+        return self._corpus
+
+
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid() or self._corpus is None:
+            return 0
+        return len(self._corpus)
+
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid() or self._corpus is None:
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self._corpus.index().itemAt(index.row())
+        return None
+
+
+    def _connectCorpus(self, corpus, connect):
+        slots = ((corpus.rowsAboutToBeInserted, self._rowsAboutToBeInsertedEvent),
+                 (corpus.rowsInserted, self._rowsInsertedEvent),
+                 (corpus.rowsAboutToBeRemoved, self._rowsAboutToBeRemovedEvent),
+                 (corpus.rowsRemoved, self._rowsRemovedEvent),
+                 (corpus.modelAboutToBeReset, self.beginResetModel),
+                 (corpus.modelReset, self.endResetModel))
+        for signal, slot in slots:
+            if connect:
+                signal.connect(slot)
+            else:
+                signal.disconnect(slot)
+
+
+    def _rowsAboutToBeInsertedEvent(self, first, last):
+        self.beginInsertRows(QModelIndex(), first, last)
+
+
+    def _rowsInsertedEvent(self, first, last):
+        self.endInsertRows()
+
+
+    def _rowsAboutToBeRemovedEvent(self, first, last):
+        self.beginRemoveRows(QModelIndex(), first, last)
+
+
+    def _rowsRemovedEvent(self, first, last):
+        self.endRemoveRows()
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の共有をやめるメソッド。
+    # @return None
+    def release(self):
+        if self._corpus is None:
+            return
+        self.beginResetModel()
+        self._connectCorpus(self._corpus, False)
+        self._corpus.detach(self)
+        self._corpus = None
+        self.endResetModel()
+
+
+
+class _CompletionSignals(QObject):
+    """_CompletionSignals class
+    _CompletionTaskからGUIスレッドへ結果を渡すためのシグナルを持つオブジェクト。
+    """
+
+    finished = Signal(int, object, object)
+
+
+
+class _CompletionTask(QRunnable):
+    """_CompletionTask class
+    補完候補の取得関数をQThreadPool上で呼び出すタスク。
+    開始前に世代番号が古くなった（新しい入力があった）場合は関数を呼ばずに終わる。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param signals (_CompletionSignals) : 結果を通知するオブジェクト
+    # @param provider (function) : 入力文字列を受け取り候補の文字列のイテラブルを返す関数
+    # @param currentGeneration (function) : 現在の世代番号を返す関数
+    # @param generation (int) : このタスクの世代番号
+    # @param prefix (str) : 入力文字列
+    # @return None
+    def __init__(self, signals, provider, currentGeneration, generation, prefix):
+        super(_CompletionTask, self).__init__()
+        self._signals = signals
+        self._provider = provider
+        self._currentGeneration = currentGeneration
+        self._generation = generation
+        self._prefix = prefix
+
+
+    def run(self):
+        if self._currentGeneration() != self._generation:
+            results = None
+        else:
+            try:
+                results = list(self._provider(self._prefix))
+            except Exception as e:
+                results = e
+
+        self._signals.finished.emit(self._generation, self._prefix, results)
+
+
+
+class AsyncCompletionSource(QObject):
+    """AsyncCompletionSource class
+    補完候補を別スレッドで取得するためのオブジェクト。requestで渡された入力文字列はDELAY(ms)の間
+    入力が止まるまで待ってからQThreadPool上でproviderに渡される。結果はresultsReadyで通知されるが、
+    その間に新しい入力があった場合、古い入力の結果は捨てられる。
+    providerは入力文字列を受け取り候補の文字列のイテラブルを返す関数か、completeメソッドを持つオブジェクト。
+    providerが例外を投げた場合はrequestFailedでメッセージが通知される。
+    """
+
+    #---------------------------------------------------------------------------
+    ## SIGNALS
+    resultsReady = Signal(object, list)
+    requestFailed = Signal(object, object)
+
+    DELAY = 150
+
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param provider (function) : 候補を返す関数、またはcompleteメソッドを持つオブジェクト
+    # @param delay (int) : [= None] 入力が止まってから取得を始めるまでの時間(ms)。NoneでDELAY
+    # @param parent (QObject) : [= None]
+    # @return None
+    def __init__(self, provider, delay = None, parent = None):
+        super(AsyncCompletionSource, self).__init__(parent)
+        if hasattr(provider, "complete"):
+            provider = provider.complete
+        self._provider = provider
+        self._generation = 0
+        self._pendingPrefix = None
+        self._tasks = {}
+        self._signals = _CompletionSignals(self)
+        self._signals.finished.connect(self._finishedEvent)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DELAY if delay is None else delay)
+        self._timer.timeout.connect(self._startRequest)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補の取得を予約するメソッド。DELAYの間に次のrequestがあった場合は、前の入力は取得しない。
+    # @param prefix (str) : 入力文字列
+    # @return None
+    def request(self, prefix):
+        self._generation += 1
+        self._pendingPrefix = prefix
+        self._timer.start()
+
+
+    #---------------------------------------------------------------------------
+    ## 予約中、取得中の候補を破棄するメソッド。
+    # @return None
+    def cancel(self):
+        self._generation += 1
+        self._pendingPrefix = None
+        self._timer.stop()
+
+
+    def _currentGeneration(self):
+        return self._generation
+
+
+    def _startRequest(self):
+        prefix = self._pendingPrefix
+        if prefix is None:
+            return
+
+        self._pendingPrefix = None
+        task = _CompletionTask(self._signals,
+                               self._provider,
+                               self._currentGeneration,
+                               self._generation,
+                               prefix)
+        task.setAutoDelete(False)
+        self._tasks[self._generation] = task
+        QThreadPool.globalInstance().start(task)
+
+
+    #---------------------------------------------------------------------------
+    ## タスクが終わった際にGUIスレッドで呼ばれるスロット(隠蔽)。最新の入力の結果だけを通知する。
+    # @param generation (int) : タスクの世代番号
+    # @param prefix (str) : 入力文字列
+    # @param results (list) : 候補の文字列のリスト。取得しなかった場合はNone、失敗した場合は例外
+    # @return None
+    def _finishedEvent(self, generation, prefix, results):
+        self._tasks.pop(generation, None)
+        if generation != self._generation or results is None:
+            return
+
+        if isinstance(results, Exception):
+            self.requestFailed.emit(prefix, str(results))
+        else:
+            self.resultsReady.emit(prefix, results)
+
 
 
 class AnyPosCompleter(QCompleter):
+    """AnyPosCompleter class
+    文字列のどの位置からでも一致する候補を表示するコンプリータ。
+    候補はCompletionIndexで索引化され、入力のたびに一つの結果モデルの中身だけを入れ替える。
+    モデルを渡した場合は、モデルが変更された後の最初の入力時に索引を作り直す。
+    入力文字列が前回の文字列を含む場合は前回の結果だけを調べ直す。また最近のRESULT_CACHE_SIZE個の
+    入力文字列の結果を保持し、BackSpace等で戻った場合は検索せずにそれを使う。
+    setCompletionProviderで候補の取得関数をセットした場合は、索引の代わりにAsyncCompletionSourceで
+    別スレッドから候補を取得し、結果が届いた時点でポップアップを更新する。取得を始める際に前の入力の結果は消す。
+    setMatchMode(AnyPosCompleter.FUZZY)では入力の文字を順に含む候補を評価の高い順に表示し、
+    ポップアップには上位maxResults個（未設定の場合はFUZZY_MAX_RESULTS個）だけが入る。
+    CompletionCorpusを渡した場合は、その索引を他のコンプリータと共有する。
+    QCompleterと異なり、大文字小文字の区別は既定でしない（Qt.CaseInsensitive）。
+    setResultFilterで関数をセットすると、その関数がFalseを返す候補を結果から除く。
+    """
+
+    SUBSTRING = "substring"
+    FUZZY = "fuzzy"
+    RESULT_CACHE_SIZE = 16
+    FUZZY_MAX_RESULTS = 50
 
 
     def __init__(self, completions = [], parent=None):
         super(AnyPosCompleter, self).__init__(parent)
         self.local_completion_prefix = ""
         self.source_model = None
+        self._index = CompletionIndex()
+        self._indexDirty = False
+        self._corpus = None
+        self._resultCache = OrderedDict()
+        self._lastSearch = None
+        self._completionSource = None
+        self._matchMode = self.SUBSTRING
+        self._maxResults = None
+        self._resultFilter = None
+        self._resultModel = QStringListModel(self)
+        super(AnyPosCompleter, self).setModel(self._resultModel)
+        self.setCaseSensitivity(Qt.CaseInsensitive)
+
+        if isinstance(completions, CompletionCorpus):
+            self.setCorpus(completions)
 
-        if isinstance(completions, QAbstractItemModel):
+        elif isinstance(completions, QAbstractItemModel):
             self.setModel(completions)
 
         elif isinstance(completions, (list, tuple)):
             if len(completions)>0:
-                model = QStringListModel(completions)
-                self.setModel(model)
+                self.setItems(completions)
 
 
+    #---------------------------------------------------------------------------
+    ## 補完候補のモデルをセットするメソッド。モデルの1列目のDisplayRoleが候補になる。
+    # @param model (QAbstractItemModel)
+    # @return None
     def setModel(self, model):
+        self._releaseSource()
         self.source_model = model
-        super(AnyPosCompleter, self).setModel(self.source_model)
+        if model is not None:
+            self._connectSourceModel(model, True)
+        self._sourceModelChanged()
+
+
+    #---------------------------------------------------------------------------
+    ## 補完候補の文字列リストをセットするメソッド。既に文字列リストがセットされている場合は
+    # CompletionIndex.updateItemsで索引を更新し、変更が無ければ何もしない。候補の順番、重複はitemsと同じになる。
+    # 結果はポップアップが表示されている場合のみすぐに取り直す。
+    # @param items (list) : list of strings
+    # @return None
+    def setItems(self, items):
+        if self.source_model is None and self._corpus is None and not self._indexDirty:
+            if self._index.updateItems(items) == 0:
+                return
+        else:
+            self._releaseSource()
+            self._index.setItems(items)
+        self._indexDirty = False
+        self._clearResultCache()
+        if self.popup().isVisible():
+            self.updateModel()
+
+
+    #---------------------------------------------------------------------------
+    ## 共有の補完候補をセットするメソッド。索引は作らず、候補の索引をそのまま使う。Noneで共有をやめる。
+    # @param corpus (CompletionCorpus)
+    # @return None
+    def setCorpus(self, corpus):
+        self._releaseSource()
+        if corpus is not None:
+            self._corpus = corpus
+            self._index = corpus.index()
+            corpus.attach(self)
+            corpus.changed.connect(self._corpusChanged)
+        self._indexDirty = False
+        self._clearResultCache()
+        self.updateModel()
+
+
+    def corpus(self):
+        return self._corpus
+
+
+    #---------------------------------------------------------------------------
+    ## セットされているモデル、共有の補完候補の接続を外すメソッド(隠蔽)。
+    # @return None
+    def _releaseSource(self):
+        if self.source_model is not None:
+            self._connectSourceModel(self.source_model, False)
+            self.source_model = None
+
+        if self._corpus is not None:
+            self._corpus.changed.disconnect(self._corpusChanged)
+            self._corpus.detach(self)
+            self._corpus = None
+            self._index = CompletionIndex()
+
+
+    #---------------------------------------------------------------------------
+    ## 共有の補完候補が変更された際に呼ばれるスロット(隠蔽)。ポップアップが表示されている場合のみ結果を取り直す。
+    # @return None
+    def _corpusChanged(self):
+        self._clearResultCache()
+        if self.popup().isVisible():
+            self.updateModel()
+
+
+    def _connectSourceModel(self, model, connect):
+        signals = (model.modelReset, model.layoutChanged, model.rowsInserted,
+                   model.rowsRemoved, model.dataChanged)
+        for signal in signals:
+            if connect:
+                signal.connect(self._sourceModelChanged)
+            else:
+                signal.disconnect(self._sourceModelChanged)
+
+
+    def _sourceModelChanged(self, *args):
+        self._indexDirty = True
+        self._clearResultCache()
+
+
+    def _clearResultCache(self):
+        self._resultCache.clear()
+        self._lastSearch = None
+
 
+    def _rebuildIndex(self):
+        model = self.source_model
+        items = []
+        if model is not None:
+            for row in range(model.rowCount()):
+                items.append(model.data(model.index(row, 0), Qt.DisplayRole))
+        self._index.setItems(items)
+        self._indexDirty = False
 
+
+    #---------------------------------------------------------------------------
+    ## 現在の入力文字列で候補を検索し、結果モデルを更新するメソッド。
+    # @return None
     def updateModel(self):
-        local_completion_prefix = self.local_completion_prefix
+        if self._completionSource is not None:
+            search = (self.local_completion_prefix, None)
+            if search != self._lastSearch:
+                self._lastSearch = search
+                self._resultModel.setStringList([])
+                self._completionSource.request(self.local_completion_prefix)
+            return
+
+        if self._indexDirty:
+            self._rebuildIndex()
+
+        search = (self.local_completion_prefix,
+                  self.caseSensitivity() == Qt.CaseSensitive,
+                  self._matchMode,
+                  self._maxResults)
+        if search == self._lastSearch:
+            return
+
+        matches = self._searchIndex(search)
+        if self._resultFilter is not None:
+            index = self._index
+            accept = self._resultFilter
+            matches = [i for i in matches if accept(index.item(i))]
+        if self._matchMode == self.FUZZY:
+            limit = self._maxResults or self.FUZZY_MAX_RESULTS
+            matches = self._index.rank(self.local_completion_prefix, matches, limit)
+        elif self._maxResults is not None:
+            matches = matches[:self._maxResults]
+
+        self._resultModel.setStringList(self._index.items(matches))
+        self._lastSearch = search
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を結果に含めるかどうかを判定する関数をセットするメソッド。検索結果のキャッシュには影響しない。
+    # @param accept (function) : 候補の文字列を受け取り、含める場合Trueを返す関数。Noneで解除
+    # @return None
+    def setResultFilter(self, accept):
+        self._resultFilter = accept
+        self.refilter()
+
+
+    #---------------------------------------------------------------------------
+    ## setResultFilterの関数の判定が変わった際に呼ぶメソッド。次の入力時に結果を作り直す。
+    # ポップアップが表示されている場合はすぐに作り直す。
+    # @return None
+    def refilter(self):
+        self._lastSearch = None
+        if self.popup().isVisible():
+            self.updateModel()
+
+
+    #---------------------------------------------------------------------------
+    ## 一致の方法をセットするメソッド。
+    # @param mode (str) : AnyPosCompleter.SUBSTRINGかAnyPosCompleter.FUZZY
+    # @return None
+    def setMatchMode(self, mode):
+        if mode not in (self.SUBSTRING, self.FUZZY):
+            raise ValueError("The match mode must be 'substring' or 'fuzzy'.")
+        self._matchMode = mode
+        self.updateModel()
+
+
+    def matchMode(self):
+        return self._matchMode
+
+
+    #---------------------------------------------------------------------------
+    ## ポップアップに表示する候補の最大数をセットするメソッド。
+    # @param limit (int) : 最大数。Noneで制限なし（FUZZYではFUZZY_MAX_RESULTS）
+    # @return None
+    def setMaxResults(self, limit):
+        self._maxResults = limit
+        self.updateModel()
+
+
+    def maxResults(self):
+        return self._maxResults
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を別スレッドで取得する関数をセットするメソッド。Noneを渡すと索引による補完に戻る。
+    # @param provider (function) : 入力文字列を受け取り候補の文字列のイテラブルを返す関数、
+    # またはcompleteメソッドを持つオブジェクト
+    # @param delay (int) : [= None] 入力が止まってから取得を始めるまでの時間(ms)
+    # @return source (AsyncCompletionSource) : 取得を行うオブジェクト。解除した場合はNone
+    def setCompletionProvider(self, provider, delay = None):
+        if self._completionSource is not None:
+            self._completionSource.cancel()
+            self._completionSource.resultsReady.disconnect(self._completionResultsEvent)
+            self._completionSource = None
+
+        if provider is not None:
+            self._completionSource = AsyncCompletionSource(provider, delay, self)
+            self._completionSource.resultsReady.connect(self._completionResultsEvent)
+
+        self._clearResultCache()
+        self.updateModel()
+        return self._completionSource
+
+
+    #---------------------------------------------------------------------------
+    ## 別スレッドで取得した候補が届いた際に呼ばれるスロット(隠蔽)。現在の入力の結果であれば
+    # 結果モデルを更新し、ウィジェットにフォーカスがある場合はポップアップを表示する。
+    # @param prefix (str) : 入力文字列
+    # @param results (list) : 候補の文字列のリスト
+    # @return None
+    def _completionResultsEvent(self, prefix, results):
+        if prefix != self.local_completion_prefix:
+            return
+
+        if self._resultFilter is not None:
+            results = [item for item in results if self._resultFilter(item)]
+        self._resultModel.setStringList(results)
+        widget = self.widget()
+        if len(prefix) > 0 and len(results) > 0 and widget is not None and widget.hasFocus():
+            self.complete()
+
+
+    #---------------------------------------------------------------------------
+    ## キャッシュ、前回の結果を使って検索するメソッド(隠蔽)。キャッシュには順位付け前の全ての一致を保持する。
+    # @param search (tuple) : (入力文字列, 大文字小文字を区別するかどうか, 一致の方法, 最大数)
+    # @return matches (list) : 一致した候補のインデックスのリスト
+    def _searchIndex(self, search):
+        prefix, caseSensitive, mode = search[:3]
+        cacheKey = search[:3]
+        matches = self._resultCache.pop(cacheKey, None)
 
-        class InnerProxyModel(QSortFilterProxyModel):
+        if matches is None:
+            candidates = None
+            lastSearch = self._lastSearch
+            if lastSearch is not None and lastSearch[1:3] == cacheKey[1:] and\
+               self._resultCache.has_key(lastSearch[:3]):
+                lastPrefix = lastSearch[0]
+                if caseSensitive:
+                    narrowing = lastPrefix in prefix
+                else:
+                    narrowing = lastPrefix.lower() in prefix.lower()
+                if narrowing:
+                    candidates = self._resultCache[lastSearch[:3]]
+            if mode == self.FUZZY:
+                matches = self._index.fuzzySearch(prefix, caseSensitive, candidates)
+            else:
+                matches = self._index.search(prefix, caseSensitive, candidates)
 
-            def filterAcceptsRow(self, sourceRow, sourceParent):
-                index0 = self.sourceModel().index(sourceRow, 0, sourceParent)
-                return local_completion_prefix.lower() in self.sourceModel().data(index0, Qt.DisplayRole).lower()
+        self._resultCache[cacheKey] = matches
+        if len(self._resultCache) > self.RESULT_CACHE_SIZE:
+            self._resultCache.popitem(last = False)
 
-        proxy_model = InnerProxyModel()
-        proxy_model.setSourceModel(self.source_model)
-        super(AnyPosCompleter, self).setModel(proxy_model)
+        return matches
 
 
     def splitPath(self, path):
         self.local_completion_prefix = path
         self.updateModel()
-        return ""
\ No newline at end of file
+        return ""
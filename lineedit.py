@@ -10,6 +10,7 @@ except ImportError:
     from PySide.QtCore import *
 
 import completer as cpl
+from bisect import bisect_left
 
 
 class HeaderLineEdit(QWidget):
@@ -129,10 +130,205 @@ class HeaderLineEdit(QWidget):
 
 
 
+class TokenIndex(object):
+    """TokenIndex class
+    セパレータで区切られた文字列の単語の位置を保持するクラス。文字列が変わった場合は変更された範囲を求め、
+    その範囲にかかる単語だけを切り出し直す。カーソル位置の単語の開始位置は二分探索で求める。
+    前後のスペースを除いた単語ごとの出現数も同時に更新し、countで定数時間で引ける。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param separator (str) : [= ","] セパレータ
+    # @return None
+    def __init__(self, separator = ","):
+        self._separator = separator
+        self._text = ""
+        self._separators = []
+        self._tokens = [""]
+        self._counts = {}
+        self._lastEdit = None
+
+
+    def text(self):
+        return self._text
+
+
+    #---------------------------------------------------------------------------
+    ## 新しい文字列で単語の位置を更新するメソッド。
+    # @param text (str) : 新しい文字列
+    # @param cursor (int) : [= None] 変更後のカーソル位置。変更範囲を求める際の手がかりに使う。
+    # @return changed (bool) : 文字列が変わっていた場合True
+    def update(self, text, cursor = None):
+        old = self._text
+        if text == old:
+            return False
+
+        start, oldEnd, newEnd = self._changedRange(old, text, cursor)
+        separators = self._separators
+        first = bisect_left(separators, start - len(self._separator) + 1)
+        last = bisect_left(separators, oldEnd)
+
+        tokenStart = separators[first - 1] + len(self._separator) if first > 0 else 0
+        oldTokenEnd = separators[last] if last < len(separators) else len(old)
+        delta = len(text) - len(old)
+
+        tokens = text[tokenStart:oldTokenEnd + delta].split(self._separator)
+        newSeparators = []
+        pos = tokenStart
+        for token in tokens[:-1]:
+            pos += len(token)
+            newSeparators.append(pos)
+            pos += len(self._separator)
+
+        self._separators = separators[:first] + newSeparators + [s + delta for s in separators[last:]]
+        self._countWords(self._tokens[first:last + 1], -1)
+        self._countWords(tokens, 1)
+        self._tokens[first:last + 1] = tokens
+        self._lastEdit = (first, last - first + 1, len(tokens))
+        self._text = text
+        return True
+
+
+    def _countWords(self, tokens, step):
+        counts = self._counts
+        for token in tokens:
+            word = token.strip(" ")
+            if word == "":
+                continue
+            count = counts.get(word, 0) + step
+            if count > 0:
+                counts[word] = count
+            else:
+                del counts[word]
+
+
+    #---------------------------------------------------------------------------
+    ## 単語の出現数を返すメソッド。
+    # @param word (str) : 前後のスペースを除いた単語
+    # @return count (int)
+    def count(self, word):
+        return self._counts.get(word, 0)
+
+
+    #---------------------------------------------------------------------------
+    ## 最後のupdateで切り出し直した範囲を返すメソッド。
+    # @return lastEdit (tuple) : (最初の単語の番号, 置き換えられた単語の数, 新しい単語の数)
+    def lastEdit(self):
+        return self._lastEdit
+
+
+    #---------------------------------------------------------------------------
+    ## 指定位置の直前にある単語の番号を返すメソッド。
+    # @param pos (int) : 文字列中の位置
+    # @return number (int) : 単語の番号
+    def tokenNumber(self, pos):
+        return bisect_left(self._separators, pos)
+
+
+    #---------------------------------------------------------------------------
+    ## 単語の番号から前後のスペースを除いた単語を返すメソッド。
+    # @param number (int) : 単語の番号
+    # @return word (str)
+    def word(self, number):
+        return self._tokens[number].strip(" ")
+
+
+    #---------------------------------------------------------------------------
+    ## 変更前後の文字列から変更された範囲を求めるメソッド(隠蔽)。カーソル位置から推定できない場合は
+    # 先頭と末尾の一致する長さを二分探索で求める。
+    # @param old (str) : 変更前の文字列
+    # @param new (str) : 変更後の文字列
+    # @param cursor (int) : 変更後のカーソル位置
+    # @return range (tuple) : (開始位置, 変更前の終了位置, 変更後の終了位置)
+    def _changedRange(self, old, new, cursor):
+        delta = len(new) - len(old)
+        if cursor is not None and 0 <= cursor <= len(new) and 0 <= cursor - delta <= len(old):
+            start = min(cursor, cursor - delta)
+            if old[:start] == new[:start] and old[cursor - delta:] == new[cursor:]:
+                return start, cursor - delta, cursor
+
+        low, high = 0, min(len(old), len(new))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if old[:middle] == new[:middle]:
+                low = middle
+            else:
+                high = middle - 1
+        start = low
+
+        low, high = 0, min(len(old), len(new)) - start
+        while low < high:
+            middle = (low + high + 1) // 2
+            if old[len(old) - middle:] == new[len(new) - middle:]:
+                low = middle
+            else:
+                high = middle - 1
+
+        return start, len(old) - low, len(new) - low
+
+
+    #---------------------------------------------------------------------------
+    ## 指定位置の直前にある単語の開始位置を返すメソッド。
+    # @param pos (int) : 文字列中の位置
+    # @return start (int) : 単語の開始位置
+    def tokenStart(self, pos):
+        i = bisect_left(self._separators, pos)
+        if i == 0:
+            return 0
+        return self._separators[i - 1] + len(self._separator)
+
+
+    #---------------------------------------------------------------------------
+    ## セパレータで区切られた単語のリストを返すメソッド。セパレータ直後のスペース1つは取り除かれ、
+    # 末尾の空の単語とスペースは無視される。
+    # @return words (list) : 単語のリスト
+    def words(self):
+        tokens = self._tokens
+        last = len(tokens)
+        while last > 0 and tokens[last - 1].strip(" ") == "":
+            last -= 1
+        if last == 0:
+            return []
+
+        words = [tokens[0]] + [token[1:] if token.startswith(" ") else token for token in tokens[1:last]]
+        words[-1] = words[-1].rstrip(" ")
+        return words
+
+
+    def tokenCount(self):
+        return len(self._tokens)
+
+
+
+class _EnteredTokenFilterModel(QSortFilterProxyModel):
+    """_EnteredTokenFilterModel class
+    入力済みの単語を補完候補から除くプロキシモデル。判定はMultiCompleteEdit.isTokenEnteredで行う。
+    """
+
+    def __init__(self, edit):
+        super(_EnteredTokenFilterModel, self).__init__(edit)
+        self._edit = edit
+
+
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        model = self.sourceModel()
+        text = model.data(model.index(sourceRow, 0, sourceParent), Qt.DisplayRole)
+        return not self._edit.isTokenEntered(text)
+
+
+
 class MultiCompleteEdit(QLineEdit):
     """MultiCompleteEdit class
     通常のCompleterはLineEdit内の文字列全体を対象に補完が行われるが
     文字列の補完をLineEdit内の単語単位で行うことができるウィジェット
+    setCompletionProviderで候補の取得関数をセットすると、候補を別スレッドで取得し、届いた時点で
+    ポップアップを更新する。
+    候補にはlistの他にCompletionCorpusを渡すことができ、その場合は他のウィジェットと候補を共有する。
+    入力された単語の位置はTokenIndexで保持し、変更された範囲だけを切り出し直す。
+    コンプリータは一つだけ作られ、setCompleteItemsでは候補の差分だけがモデルに反映される。
+    setExcludeEnteredTokens(True)で入力済みの単語を候補から除き、setRejectDuplicates(True)で
+    入力済みの単語の補完を受け付けなくなる。入力済みかどうかはTokenIndexの出現数で判定する。
     """
 
     completed = Signal(str)
@@ -140,7 +336,7 @@ class MultiCompleteEdit(QLineEdit):
 
     #---------------------------------------------------------------------------
     ## コンストラクタ。
-    # @param model (list) : [= []] list of strings
+    # @param model (list) : [= []] list of strings, or CompletionCorpus
     # @param separator (string) : [= ","] default is comma
     # @param addSpaceAfterCompleting (bool) : [= True] 補完後の文字列の最後にスペースを入れるかどうか
     # @param parent (QWidget) : [= None]
@@ -150,10 +346,23 @@ class MultiCompleteEdit(QLineEdit):
         self._caseSensitivity = Qt.CaseInsensitive
         self._separator = separator
         self._addSpaceAfterCompleting = addSpaceAfterCompleting
-        self._completer = QCompleter(model)
+        self._tokenIndex = TokenIndex(separator)
+        self._currentToken = 0
+        self._currentWord = ""
+        self._excludeEnteredTokens = False
+        self._rejectDuplicates = False
+        self._itemsModel = QStringListModel(self)
+        self._providerModel = None
+        self._completerSourceModel = None
+        self._completerItemsModel = None
+        self._enteredFilterModel = None
+        self._completer = self._createCompleter()
         self._completer.setWidget(self)
         self._completer.setCaseSensitivity(self._caseSensitivity)
         self.connect(self._completer, SIGNAL('activated(QString)'), self._insertCompletion)
+        self._completionSource = None
+        self.setCompleteItems(model)
+        self.textChanged.connect(self._textChangedEvent)
         self._keysToIgnore = [Qt.Key_Enter,
                               Qt.Key_Return,
                               Qt.Key_Escape,
@@ -172,6 +381,10 @@ class MultiCompleteEdit(QLineEdit):
 #             extra_text = ""
 #         else:
 #             extra_text = completion[-extra:]
+        if self._rejectDuplicates and self.isTokenEntered(completion):
+            self._completer.popup().hide()
+            return
+
         lastLabel = self.text()[:-len(self._completer.completionPrefix())]
 
         if self._addSpaceAfterCompleting:
@@ -184,17 +397,124 @@ class MultiCompleteEdit(QLineEdit):
 
 
 
+    #---------------------------------------------------------------------------
+    ## textChangedシグナルを受けて単語の位置を更新するメソッド(隠蔽)。
+    # @param text (str) : 変更後の文字列
+    # @return None
+    def _textChangedEvent(self, text):
+        self._updateTokenIndex(text)
+
+
+    #---------------------------------------------------------------------------
+    ## 単語の位置を現在の文字列に合わせて返すメソッド(隠蔽)。シグナルを止めている間に文字列が
+    # 変わった場合もここで更新される。
+    # @return tokenIndex (TokenIndex)
+    def _syncTokenIndex(self):
+        return self._updateTokenIndex(self.text())
+
+
+    #---------------------------------------------------------------------------
+    ## 単語の位置とカーソル位置の単語を更新するメソッド(隠蔽)。カーソル位置の単語以外の入力済みの単語が
+    # 変わった場合のみ、補完候補の除外をやり直す。
+    # @param text (str) : 現在の文字列
+    # @return tokenIndex (TokenIndex)
+    def _updateTokenIndex(self, text):
+        tokenIndex = self._tokenIndex
+        cursor = self.cursorPosition()
+        changed = tokenIndex.update(text, cursor)
+        current = tokenIndex.tokenNumber(cursor)
+
+        if changed:
+            first, removed, added = tokenIndex.lastEdit()
+            enteredChanged = not (removed == 1 and added == 1 and first == current == self._currentToken)
+        else:
+            enteredChanged = current != self._currentToken
+
+        self._currentToken = current
+        self._currentWord = tokenIndex.word(current)
+        if enteredChanged and self._excludeEnteredTokens:
+            self._enteredTokensChanged()
+
+        return tokenIndex
+
+
+    #---------------------------------------------------------------------------
+    ## 単語が既に入力されているかどうかを返すメソッド。カーソル位置の入力中の単語は数えない。
+    # @param text (str) : 単語
+    # @return entered (bool)
+    def isTokenEntered(self, text):
+        word = text.strip(" ")
+        count = self._tokenIndex.count(word)
+        if word == self._currentWord:
+            count -= 1
+        return count > 0
+
+
+    #---------------------------------------------------------------------------
+    ## 入力済みの単語を補完候補から除くかどうかを設定するメソッド。
+    # @param exclude (bool)
+    # @return None
+    def setExcludeEnteredTokens(self, exclude):
+        self._excludeEnteredTokens = exclude
+        self._syncTokenIndex()
+        self._applyEnteredTokenFilter()
+
+
+    def excludeEnteredTokens(self):
+        return self._excludeEnteredTokens
+
+
+    #---------------------------------------------------------------------------
+    ## 入力済みの単語の補完を受け付けないかどうかを設定するメソッド。Trueの場合はgetTextListでも
+    # 重複した単語は最初の一つだけが返る。
+    # @param reject (bool)
+    # @return None
+    def setRejectDuplicates(self, reject):
+        self._rejectDuplicates = reject
+
+
+    def rejectDuplicates(self):
+        return self._rejectDuplicates
+
+
+    #---------------------------------------------------------------------------
+    ## 入力済みの単語の除外の設定をコンプリータに反映するメソッド(隠蔽)。除外する場合のみ候補のモデルを
+    # プロキシモデルで包む。
+    # @return None
+    def _applyEnteredTokenFilter(self):
+        self._setCompleterModel(self._completerSourceModel)
+
+
+    #---------------------------------------------------------------------------
+    ## 入力済みの単語が変わった際に呼ばれるメソッド(隠蔽)。
+    # @return None
+    def _enteredTokensChanged(self):
+        if self._enteredFilterModel is not None:
+            self._enteredFilterModel.invalidate()
+
+
+    #---------------------------------------------------------------------------
+    ## コンプリータに候補のモデルをセットするメソッド(隠蔽)。
+    # @param model (QAbstractItemModel)
+    # @return None
+    def _setCompleterModel(self, model):
+        self._completerSourceModel = model
+        if self._excludeEnteredTokens:
+            if self._enteredFilterModel is None:
+                self._enteredFilterModel = _EnteredTokenFilterModel(self)
+            self._enteredFilterModel.setSourceModel(model)
+            self._completer.setModel(self._enteredFilterModel)
+        else:
+            self._completer.setModel(model)
+
+
     #---------------------------------------------------------------------------
     ## 現在のカーソル位置から、セパレータまでの文字列を一単語として返すメソッド。
     # @return textUnderCursor (str) : 空文字、セパレータ無しの文字列
     def textUnderCursor(self):
-        text = self.text()
-        textUnderCursor = ''
-        i = self.cursorPosition() - 1
-
-        while i >=0 and text[i] != self._separator:
-            textUnderCursor = text[i] + textUnderCursor
-            i -= 1
+        tokenIndex = self._syncTokenIndex()
+        cursor = self.cursorPosition()
+        textUnderCursor = tokenIndex.text()[tokenIndex.tokenStart(cursor):cursor]
 
         if self._addSpaceAfterCompleting and\
            len(textUnderCursor) > 0 and\
@@ -219,8 +539,12 @@ class MultiCompleteEdit(QLineEdit):
 
         if completionPrefix != self._completer.completionPrefix():
             self._updateCompleterPopupItems(completionPrefix)
+            if self._completionSource is not None:
+                self._providerModel.setStringList([])
+                self._completer.popup().hide()
+                self._completionSource.request(completionPrefix)
 
-        if len(event.text()) > 0 and len(completionPrefix) > 0:
+        if self._completionSource is None and len(event.text()) > 0 and len(completionPrefix) > 0:
             self.blockSignals(True) ## block emitting 'editingFinished' signal
             self._completer.complete()
             self.blockSignals(False)
@@ -241,14 +565,97 @@ class MultiCompleteEdit(QLineEdit):
 
 
     #---------------------------------------------------------------------------
-    ## 補完用の文字列リストをセットする関数。
-    # @param items (list) : list of strings
+    ## ウィジェットで使うコンプリータを作るメソッド(隠蔽)。コンストラクタで一度だけ呼ばれる。
+    # @return completer (QCompleter)
+    def _createCompleter(self):
+        return QCompleter(self)
+
+
+    #---------------------------------------------------------------------------
+    ## 補完用の文字列リストをセットする関数。コンプリータは作り直さず、無くなった候補の削除と
+    # 増えた候補の挿入だけをモデルに反映する。
+    # setCompletionProviderで取得関数がセットされている場合は、解除された後に使う候補として保持する。
+    # @param items (list) : list of strings, or CompletionCorpus
     # @return None
     def setCompleteItems(self, items):
-        self._completer = QCompleter(items)
-        self._completer.setWidget(self)
-        self._completer.setCaseSensitivity(self._caseSensitivity)
-        self.connect(self._completer, SIGNAL('activated(QString)'), self._insertCompletion)
+        model = self._completerItemsModel
+
+        if isinstance(items, cpl.CompletionCorpus):
+            if isinstance(model, cpl.CompletionCorpusModel) and model.corpus() is items:
+                return
+            self._releaseCompleterModel()
+            self._setItemsModel(cpl.CompletionCorpusModel(items, self))
+        else:
+            self._releaseCompleterModel()
+            if model is not self._itemsModel:
+                self._setItemsModel(self._itemsModel)
+            cpl.updateStringListModel(self._itemsModel, items)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補のモデルをセットするメソッド(隠蔽)。取得関数がセットされている間はコンプリータには渡さず、
+    # 解除された時に渡す。
+    # @param model (QAbstractItemModel)
+    # @return None
+    def _setItemsModel(self, model):
+        self._completerItemsModel = model
+        if self._completionSource is None:
+            self._setCompleterModel(model)
+
+
+    #---------------------------------------------------------------------------
+    ## 現在の候補が共有の候補を使っている場合に、共有をやめるメソッド(隠蔽)。
+    # @return None
+    def _releaseCompleterModel(self):
+        model = self._completerItemsModel
+        if isinstance(model, cpl.CompletionCorpusModel):
+            model.release()
+            model.deleteLater()
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を別スレッドで取得する関数をセットするメソッド。入力中の単語が渡され、返された候補がそのまま
+    # ポップアップに表示される。入力が変わると前の結果は消え、ポップアップは新しい結果が届いた時に開く。
+    # Noneを渡すと解除され、セットされていた候補での補完に戻る。
+    # @param provider (function) : 入力文字列を受け取り候補の文字列のイテラブルを返す関数、
+    # またはcompleteメソッドを持つオブジェクト
+    # @param delay (int) : [= None] 入力が止まってから取得を始めるまでの時間(ms)
+    # @return source (AsyncCompletionSource) : 取得を行うオブジェクト。解除した場合はNone
+    def setCompletionProvider(self, provider, delay = None):
+        if self._completionSource is not None:
+            self._completionSource.cancel()
+            self._completionSource.resultsReady.disconnect(self._completionResultsEvent)
+            self._completionSource = None
+            self._setCompleterModel(self._completerItemsModel)
+            self._completer.setCompletionMode(QCompleter.PopupCompletion)
+
+        if provider is not None:
+            self._completionSource = cpl.AsyncCompletionSource(provider, delay, self)
+            self._completionSource.resultsReady.connect(self._completionResultsEvent)
+            if self._providerModel is None:
+                self._providerModel = QStringListModel(self)
+            self._providerModel.setStringList([])
+            self._setCompleterModel(self._providerModel)
+            self._completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+
+        return self._completionSource
+
+
+    #---------------------------------------------------------------------------
+    ## 別スレッドで取得した候補が届いた際に呼ばれるスロット(隠蔽)。入力中の単語の結果であればポップアップを更新する。
+    # @param prefix (str) : 入力文字列
+    # @param results (list) : 候補の文字列のリスト
+    # @return None
+    def _completionResultsEvent(self, prefix, results):
+        if prefix != self.textUnderCursor():
+            return
+
+        self._providerModel.setStringList(results)
+        self._updateCompleterPopupItems(prefix)
+        if len(prefix) > 0 and len(results) > 0 and self.hasFocus():
+            self.blockSignals(True)
+            self._completer.complete()
+            self.blockSignals(False)
 
 
     #---------------------------------------------------------------------------
@@ -264,16 +671,17 @@ class MultiCompleteEdit(QLineEdit):
     ## 入力された文字列を切り出してリストとして取得するための関数。
     # @return words (list) : 入力された単語リスト
     def getTextList(self):
-        text = self.text()
-        if len(text) == 0:
-            return []
+        words = self._syncTokenIndex().words()
+        if not self._rejectDuplicates:
+            return words
 
-        while text[-1] in [",", " "]:
-            text = text[:-1]
-
-        words = text.replace(", ", ",").split(",")
-        #words = list(set(words))
-        return words
+        uniqueWords = []
+        entered = set()
+        for word in words:
+            if word not in entered:
+                uniqueWords.append(word)
+                entered.add(word)
+        return uniqueWords
 
 
 class AnyPosMultiCompleteEdit(MultiCompleteEdit):
@@ -281,12 +689,44 @@ class AnyPosMultiCompleteEdit(MultiCompleteEdit):
 
     def __init__(self, model = [], separator = ',', addSpaceAfterCompleting = True, parent = None):
         super(AnyPosMultiCompleteEdit, self).__init__(model, separator, addSpaceAfterCompleting, parent)
-        self.setCompleteItems(model)
 
 
+    def _createCompleter(self):
+        return cpl.AnyPosCompleter(parent = self)
+
+
+    def _applyEnteredTokenFilter(self):
+        if self._excludeEnteredTokens:
+            self._completer.setResultFilter(self._acceptCompletion)
+        else:
+            self._completer.setResultFilter(None)
+
+
+    def _enteredTokensChanged(self):
+        self._completer.refilter()
+
+
+    def _acceptCompletion(self, text):
+        return not self.isTokenEntered(text)
+
+
+    #---------------------------------------------------------------------------
+    ## 補完用の文字列リストをセットする関数。AnyPosCompleterの索引は作り直さず、差分だけを反映する。
+    # @param items (list) : list of strings, or CompletionCorpus
+    # @return None
     def setCompleteItems(self, items):
-        self._completer = cpl.AnyPosCompleter(items)
-        self._completer.setWidget(self)
-        self._completer.setCaseSensitivity(self._caseSensitivity)
-        self.connect(self._completer, SIGNAL('activated(QString)'), self._insertCompletion)
+        if isinstance(items, cpl.CompletionCorpus):
+            if self._completer.corpus() is not items:
+                self._completer.setCorpus(items)
+        else:
+            self._completer.setItems(items)
+
+
+    #---------------------------------------------------------------------------
+    ## 候補を別スレッドで取得する関数をセットするメソッド。AnyPosCompleterに処理を任せる。
+    # @param provider (function) : 入力文字列を受け取り候補の文字列のイテラブルを返す関数
+    # @param delay (int) : [= None] 入力が止まってから取得を始めるまでの時間(ms)
+    # @return source (AsyncCompletionSource) : 取得を行うオブジェクト。解除した場合はNone
+    def setCompletionProvider(self, provider, delay = None):
+        return self._completer.setCompletionProvider(provider, delay)
 
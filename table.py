@@ -9,41 +9,390 @@ except ImportError:
     from PySide.QtGui import *
     from PySide.QtCore import *
 
+import time
+from collections import OrderedDict
+from itertools import islice
+
 import utility as util
 
 
-class ConfigTableWidget(QTableWidget):
-    """ConfigTableWidget class
-    テーブルの各カラムの設定を辞書のリストで容易に設定できるテーブル。
-    例）[{'key':'name', 'display':'Name', 'type':'str', 'visible':True, 'width':200}]
-    typeはaddItemに与えるデータの各キーの値の型。'int','bool','str','list','dict'が指定可能。
-    データは階層型辞書でも可（2階層まで）。その際はsubKey、subTypeを指定する。
-    各セルデータの追加も、辞書データを渡すことで対応するキーの値を各カラムに追加できる。
-    追加の処理が必要な場合はサブクラス化し、addItemメソッド等を上書きする。
+class ColumnIndex(object):
+    """ColumnIndex class
+    カラム設定から(key, subKey)をキーにしたカラム番号（論理インデックス）の辞書を作成し、
+    カラムの検索を定数時間で行うためのクラス。ヘッダーをドラッグで並び替えても論理インデックスは
+    変わらないため、索引は設定が変わらない限り作り直す必要はない。
+    """
+
+    ## subKeyを持たないカラムを表す索引上のサブキー
+    ANY_SUBKEY = object()
+
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param configuration (list) : list of dict. カラムの設定情報
+    # @return None
+    def __init__(self, configuration):
+        self._config = configuration
+        self._sections = {}
+        for i, colInfo in enumerate(self._config):
+            key = colInfo.get(ConfigTableWidget.KEY)
+            if colInfo.has_key(ConfigTableWidget.SUBKEY):
+                self._sections.setdefault((key, colInfo.get(ConfigTableWidget.SUBKEY)), i)
+            else:
+                self._sections.setdefault((key, self.ANY_SUBKEY), i)
+
+
+    #---------------------------------------------------------------------------
+    ## キー、サブキーに一致するカラム番号を返すメソッド。subKeyを持たないカラムはsubKeyに関係なく一致する。
+    # 複数一致する場合は設定順で先にあるカラムを返す。
+    # @param key (str) : カラムのキー
+    # @param subKey (str) : [= None] カラムのサブキー
+    # @return section (int) : カラム番号
+    def section(self, key, subKey = None):
+        exact = self._sections.get((key, subKey))
+        anySubKey = self._sections.get((key, self.ANY_SUBKEY))
+
+        if exact is None and anySubKey is None:
+            raise AttributeError("Configuration doesn't have specified key or information.")
+        if exact is None:
+            return anySubKey
+        if anySubKey is None:
+            return exact
+
+        return min(exact, anySubKey)
+
+
+    #---------------------------------------------------------------------------
+    ## カラム番号からカラムの設定情報を返すメソッド。
+    # @param section (int) : カラム番号（論理インデックス）
+    # @return colInfo (dict) : カラムの設定情報
+    def columnInfo(self, section):
+        return self._config[section]
+
+
+## typeと値を表示用文字列に変換する関数の対応表。ConfigTableWidget.TYPE_FORMATTERSの既定値。
+DEFAULT_TYPE_FORMATTERS = {"str"   : lambda value: value,
+                           "string": lambda value: value,
+                           "int"   : str,
+                           "bool"  : str}
+
+## 表示文字列ではなく値の大小でソートするtype。ConfigTableWidgetとConfigTableModelのVALUE_SORT_TYPESの既定値。
+DEFAULT_VALUE_SORT_TYPES = ("int", "bool")
+
+
+class ColumnFormatter(object):
+    """ColumnFormatter class
+    カラム設定1つ分をコンパイルした、値の取り出しと文字列化を行う呼び出し可能オブジェクト。
+    設定のkey、type等の判定は生成時に一度だけ行い、カラムの種類（スカラー、辞書のサブキー、
+    スカラーのリスト、辞書のリスト）ごとに専用のメソッドをextract、formatに割り当てる。
+    formatter(itemData)で、ConfigTableWidget._setItemCoreと同じ文字列が返る。
+    valueTypeはextractが返す値の型名（リストのカラムはNone）で、ソート方法の判定に使う。
+    リストのカラムにlistLimitが指定されている場合、formatは先頭のlistLimit個と残りの個数だけの要約を返し、
+    全体の文字列はformatFullで作成する。
+    """
+
+    SCALAR       = "scalar"
+    DICT         = "dict"
+    LIST         = "list"
+    LIST_OF_DICT = "listOfDict"
+
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param colInfo (dict) : カラムの設定情報
+    # @param typeFormatters (dict) : typeをキー、値を文字列にする関数を値とした辞書
+    # @param separator (str) : [= ", "] リストを連結する際の区切り文字
+    # @return None
+    def __init__(self, colInfo, typeFormatters, separator = ", "):
+        self.colInfo = colInfo
+        self.key = colInfo[ConfigTableWidget.KEY]
+        self.subKey = colInfo.get(ConfigTableWidget.SUBKEY)
+        self.separator = separator
+        self.listLimit = None
+
+        colType = colInfo[ConfigTableWidget.TYPE]
+        subType = colInfo.get(ConfigTableWidget.SUBTYPE)
+
+        if colType == "dict":
+            self.kind = self.DICT
+            self.valueType = subType
+            self.extract = self._extractSubKey
+            self.format = self._makeValueFormatter(typeFormatters, subType)
+
+        elif colType == "list":
+            self.valueType = None
+            self.extract = self._extractValue
+            if subType == "dict":
+                self.kind = self.LIST_OF_DICT
+                self.formatFull = self._formatListOfDict
+            else:
+                self.kind = self.LIST
+                self._formatElement = self._makeValueFormatter(typeFormatters, subType)
+                self.formatFull = self._formatList
+
+            self.listLimit = colInfo.get(ConfigTableWidget.LIST_LIMIT)
+            if self.listLimit is None:
+                self.format = self.formatFull
+            else:
+                formatFull = self.formatFull
+                listLimit = self.listLimit
+                self.format = lambda value: formatFull(value, listLimit)
+
+        else:
+            self.kind = self.SCALAR
+            self.valueType = colType
+            self.extract = self._extractValue
+            self.format = self._makeValueFormatter(typeFormatters, colType)
+
+        if self.kind in (self.SCALAR, self.DICT):
+            self.formatFull = self.format
+
+
+    #---------------------------------------------------------------------------
+    ## itemDataからセルの文字列を作成する。値が取れない場合はAttributeErrorが発生する。
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return label (str) : カラムの文字列
+    def __call__(self, itemData):
+        return self.format(self.extract(itemData))
+
+
+    #---------------------------------------------------------------------------
+    ## 値1つを文字列にする関数を作成する(隠蔽)。Noneや未登録のtypeの場合は空文字列になる。
+    # @param typeFormatters (dict) : typeをキー、値を文字列にする関数を値とした辞書
+    # @param typeName (str) : 値のtype
+    # @return formatter (function)
+    def _makeValueFormatter(self, typeFormatters, typeName):
+        func = typeFormatters.get(typeName)
+        if func is None:
+            return lambda value: ""
+
+        return lambda value: "" if value is None else func(value)
+
+
+    def _extractValue(self, itemData):
+        if not itemData.has_key(self.key):
+            raise AttributeError("Data doesn't have key '%s'." % self.key)
+
+        return itemData[self.key]
+
+
+    def _extractSubKey(self, itemData):
+        value = self._extractValue(itemData)
+        if not isinstance(value, dict) or not value.has_key(self.subKey):
+            raise AttributeError("Data doesn't have subKey '%s' of key '%s'." % (self.subKey, self.key))
+
+        return value[self.subKey]
+
+
+    def _formatList(self, value, limit = None):
+        if not isinstance(value, list):
+            return ""
+
+        formatElement = self._formatElement
+        if limit is not None and len(value) > limit:
+            return self._summarize([formatElement(v) for v in value[:limit]], len(value) - limit)
+
+        return self.separator.join([formatElement(v) for v in value])
+
+
+    def _formatListOfDict(self, value, limit = None):
+        if not isinstance(value, list):
+            return ""
+
+        if limit is not None and len(value) > limit:
+            return self._summarize(util.makeListByDictKey(self.subKey, value[:limit]), len(value) - limit)
+
+        return self.separator.join(util.makeListByDictKey(self.subKey, value))
+
+
+    #---------------------------------------------------------------------------
+    ## リストの要約文字列を作成する(隠蔽)。例）"a, b, c ... +4,980 more"
+    # @param labels (list) : 先頭の要素の文字列のリスト
+    # @param restCount (int) : 省略した要素の数
+    # @return summary (str)
+    def _summarize(self, labels, restCount):
+        return "%s ... +%s more" % (self.separator.join(labels), "{:,}".format(restCount))
+
+
+class FormattedValueCache(object):
+    """FormattedValueCache class
+    (行ID, カラム番号)をキーにした表示文字列のキャッシュ。maxSizeを超えた場合は最も長く使われていないものから捨てる。
+    行の値が変わった場合は、変わったキーに対応するカラムだけをinvalidateで破棄する。
+    hits、missesはプロファイル用のヒット数、ミス数。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param maxSize (int) : [= 100000] 保持する文字列の最大数
+    # @return None
+    def __init__(self, maxSize = 100000):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._labels = OrderedDict()
+
+
+    #---------------------------------------------------------------------------
+    ## キャッシュされた文字列を返すメソッド。無い場合はNoneを返す。見つかった文字列は最近使ったものとして扱う。
+    # @param rowId (int) : 行ID
+    # @param col (int) : カラム番号
+    # @return label (str)
+    def lookup(self, rowId, col):
+        label = self._labels.pop((rowId, col), None)
+        if label is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._labels[(rowId, col)] = label
+        return label
+
+
+    #---------------------------------------------------------------------------
+    ## 文字列をキャッシュに入れるメソッド。
+    # @param rowId (int) : 行ID
+    # @param col (int) : カラム番号
+    # @param label (str) : 表示文字列
+    # @return None
+    def store(self, rowId, col, label):
+        if self._labels.pop((rowId, col), None) is None and len(self._labels) >= self.maxSize:
+            self._labels.popitem(last = False)
+        self._labels[(rowId, col)] = label
+
+
+    #---------------------------------------------------------------------------
+    ## 指定した行のカラムのキャッシュを破棄するメソッド。
+    # @param rowId (int) : 行ID
+    # @param columns (list) : カラム番号のリスト
+    # @return None
+    def invalidate(self, rowId, columns):
+        for col in columns:
+            self._labels.pop((rowId, col), None)
+
+
+    def clear(self):
+        self._labels.clear()
+
+
+    #---------------------------------------------------------------------------
+    ## 統計情報を返すメソッド。
+    # @return stats (dict) : hits, misses, sizeをキーに持つ辞書
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._labels)}
+
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+
+class _RowFormatSignals(QObject):
+    """_RowFormatSignals class
+    _RowFormatTaskからGUIスレッドへ結果を渡すためのシグナルを持つオブジェクト。
+    GUIスレッドで作成するため、シグナルはキューを介してGUIスレッドで受け取られる。
+    """
+
+    chunkFormatted = Signal(int, int, object)
+
+
+
+class _RowFormatTask(QRunnable):
+    """_RowFormatTask class
+    行の辞書データの塊を、QThreadPool上でセルの文字列に変換するタスク。
+    世代番号が古くなった（新しい読み込みが始まった）場合は途中で処理をやめ、結果にNoneを渡す。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param signals (_RowFormatSignals) : 結果を通知するオブジェクト
+    # @param formatRow (function) : 行の辞書データを受け取りセルの内容を返す関数
+    # @param currentGeneration (function) : 現在の世代番号を返す関数
+    # @param generation (int) : このタスクの世代番号
+    # @param index (int) : 塊の番号
+    # @param items (list) : 辞書データのリスト
+    # @return None
+    def __init__(self, signals, formatRow, currentGeneration, generation, index, items):
+        super(_RowFormatTask, self).__init__()
+        self._signals = signals
+        self._formatRow = formatRow
+        self._currentGeneration = currentGeneration
+        self._generation = generation
+        self._index = index
+        self._items = items
+
+
+    def run(self):
+        rows = []
+        for itemData in self._items:
+            if self._currentGeneration() != self._generation:
+                rows = None
+                break
+            rows.append((itemData, self._formatRow(itemData)))
+
+        self._signals.chunkFormatted.emit(self._generation, self._index, rows)
+
+
+
+class _ValueFormatDelegate(QStyledItemDelegate):
+    """_ValueFormatDelegate class
+    値でソートするカラムに使うデリゲート。セルのQt.DisplayRoleには値そのものがセットされているため、
+    描画する時にカラムのColumnFormatterで表示文字列に変換する。
+    値のままセットしておくことで、ソートはQTableWidgetItemの標準の比較（C++側）で行われる。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param table (ConfigTableWidget) : 対象のテーブル
+    # @param col (int) : 列インデックス
+    # @return None
+    def __init__(self, table, col):
+        super(_ValueFormatDelegate, self).__init__(table)
+        self._table = table
+        self._col = col
+
+
+    def displayText(self, value, locale):
+        if value is None or value == "":
+            return ""
+        return self._table.columnFormatters[self._col].format(value)
+
+
+
+class _ConfigTableMixin(object):
+    """_ConfigTableMixin class
+    ConfigTableWidgetとConfigTableViewで共通の、カラム設定の扱いとヘッダーの設定を持つクラス。
+    カラムの検索、表示切り替え、選択行の取得、'width':'auto'のカラムの幅調整の枠組みを持つ。
+    幅の計測方法はクラスごとに異なるため、_autoWidthContentWidthsをサブクラスで実装する。
     """
 
     KEY     = "key"
     SUBKEY  = "subKey"
     DISPLAY = "display"
     WIDTH   = "width"
-    TYPE    = "type"
-    SUBTYPE = "subType"
     VISIBLE = "visible"
-    SEPARATOR = ", "
+    MIN_WIDTH = "minWidth"
+    MAX_WIDTH = "maxWidth"
+    AUTO_WIDTH = "auto"
+    AUTO_WIDTH_MIN = 40
+    AUTO_WIDTH_MAX = 400
+    AUTO_WIDTH_PADDING = 16
+    AUTO_WIDTH_DELAY = 100
 
 
-    #---------------------------------------------------------------------------
-    ## コンストラクタ。テーブル設定データをここで渡す。
-    # @param configuration (list) : list of dict. 詳細はクラスディスクリプションに記述
-    # @param parent (QWidget) : [= None]
+    #-------------------------------------------------------------------------
+    ## カラム設定と幅の自動調整に使う状態を初期化するメソッド(隠蔽)。各クラスのコンストラクタから呼ぶ。
+    # @param configuration (list) : list of dict. 詳細はConfigTableWidgetのクラスディスクリプションに記述
+    # @param parent (QWidget) : 親ウィジェット
     # @return None
-    def __init__(self, configuration, parent = None):
-        super(ConfigTableWidget, self).__init__(parent)
+    def _initConfig(self, configuration, parent):
         self._config = configuration
         self._parent = parent
-        self._initSettings()
-        self.setSignals()
-        self._setHeaderSetting()
+        self._columnIndex = ColumnIndex(self._config)
+        self._autoWidthColumns = {}
+        self._autoWidthUpdating = False
+        self._autoWidthTimer = QTimer(self)
+        self._autoWidthTimer.setSingleShot(True)
+        self._autoWidthTimer.timeout.connect(self.resizeAutoWidthColumns)
 
 
     #-------------------------------------------------------------------------
@@ -51,8 +400,6 @@ class ConfigTableWidget(QTableWidget):
     # @param None
     # @return None
     def _initSettings(self):
-        self.setColumnCount(len(self._config))
-        self.setHorizontalHeaderLabels(util.makeListByDictKey(self.DISPLAY, self._config))
         self.verticalHeader().setVisible(False)
         self.verticalHeader().setDefaultSectionSize(20)
         self.horizontalHeader().setMovable(True)
@@ -78,41 +425,65 @@ class ConfigTableWidget(QTableWidget):
     # @param None
     # @return None
     def _setHeaderSetting(self):
-
         for i, colInfo in enumerate(self._config):
             self.setColumnVisibe(i, colInfo.get(self.VISIBLE))
-            if colInfo.get(self.WIDTH) is not None:
+            if colInfo.get(self.WIDTH) == self.AUTO_WIDTH:
+                self._autoWidthColumns[i] = []
+            elif colInfo.get(self.WIDTH) is not None:
                 self.setColumnWidth(i, colInfo.get(self.WIDTH))
 
+        if len(self._autoWidthColumns) > 0:
+            self.horizontalHeader().sectionResized.connect(self._sectionResizedEvent)
+            self.verticalScrollBar().valueChanged.connect(self._scheduleAutoWidth)
+            self.resizeAutoWidthColumns()
+
 
     #-------------------------------------------------------------------------
-    ## 設定情報のキーを渡して、カラム番号を返すメソッド。カラムの辞書データをそのまま渡すか、キーを指定する。
-    # サブキーがある場合はサブキーを指定する。
-    # @param colInfo (dict) : 設定情報の各カラムの辞書
-    # @param key (str) : カラムのキー
-    # @param subKey (str) : カラムのサブキー
-    # @return section (int) : カラム番号
-    def getHeaderSectionByKey(self, colInfo = None, key = None, subKey = None):
-        if key is None and subKey is None and colInfo is None:
-            raise ValueError("The arguments, 'colInfo' or 'key', must be supecified.")
+    ## 'width':'auto'のカラムの幅を計算して設定するメソッド。中身の幅は_autoWidthContentWidthsで
+    # 一部の行だけを計測するため、行数に関係なく一定の時間で終わる。現在の幅より狭くはしない。
+    # @return None
+    def resizeAutoWidthColumns(self):
+        if len(self._autoWidthColumns) == 0:
+            return
 
-        if colInfo is not None:
-            key = colInfo.get(self.KEY)
-            subKey = colInfo.get(self.SUBKEY)
+        contentWidths = self._autoWidthContentWidths()
+        headerMetrics = self.horizontalHeader().fontMetrics()
+
+        self._autoWidthUpdating = True
+        try:
+            for col, contentWidth in contentWidths.items():
+                colInfo = self._config[col]
+                width = max(contentWidth,
+                            headerMetrics.width(colInfo.get(self.DISPLAY, "")) + self.AUTO_WIDTH_PADDING)
+                width = max(width, colInfo.get(self.MIN_WIDTH, self.AUTO_WIDTH_MIN))
+                width = min(width, colInfo.get(self.MAX_WIDTH, self.AUTO_WIDTH_MAX))
+                if width > self.columnWidth(col):
+                    self.setColumnWidth(col, width)
+        finally:
+            self._autoWidthUpdating = False
+
+
+    #-------------------------------------------------------------------------
+    ## 'width':'auto'のカラムの中身の幅を計測するメソッド(隠蔽)。サブクラスで実装する。
+    # @return widths (dict) : カラム番号と、余白を含めた中身の幅の辞書
+    def _autoWidthContentWidths(self):
+        raise NotImplementedError
+
+
+    def _scheduleAutoWidth(self, *args):
+        if len(self._autoWidthColumns) > 0 and not self._autoWidthTimer.isActive():
+            self._autoWidthTimer.start(self.AUTO_WIDTH_DELAY)
 
-        for i, item in enumerate(self._config):
-            if item.get(self.KEY) == key:
-                if item.has_key(self.SUBKEY):
-                    if item.get(self.SUBKEY) == subKey:
-                        return i
-                    else:
-                        continue
-                else:
-                    return i
-            else:
-                continue
 
-        raise AttributeError("Configuration doesn't have specified key or information.")
+    #-------------------------------------------------------------------------
+    ## ヘッダーのsectionResizedシグナルを受けるメソッド(隠蔽)。手動で幅を変えたカラムは自動調整をやめる。
+    # @param logicalIndex (int) : カラム番号
+    # @param oldSize (int) : 変更前の幅
+    # @param newSize (int) : 変更後の幅
+    # @return None
+    def _sectionResizedEvent(self, logicalIndex, oldSize, newSize):
+        if not self._autoWidthUpdating:
+            self._autoWidthColumns.pop(logicalIndex, None)
 
 
     #-------------------------------------------------------------------------
@@ -128,133 +499,911 @@ class ConfigTableWidget(QTableWidget):
 
 
     #-------------------------------------------------------------------------
-    ## 値を表示用に変換するメソッド
-    # @param value (object) : 値
-    # @param colType (str) : valueのタイプ。(str,string,int,bool)
-    # @return converted (string) : 変換できない場合、空文字列が返る。
-    def _makeItemString(self, value, colType):
-        if value is None:
-            return ""
-        if colType in ("str", "string"):
-            return value
-        if colType in ("int"):
-            return str(value)
-        if colType in ("bool"):
-            return str(value)
-
-        return ""
-
-
-    #-------------------------------------------------------------------------
-    ## 新しくテーブルにアイテムを追加するメソッド。辞書を引数に取り、キーが対応するカラムに値を入れていく。
-    # カラムのデータが取れない場合は空文字列のアイテムが作成される。
-    # オリジナルの辞書データも作成されたアイテムのitemData属性にセットされる。同じ行のアイテム同士は同じ辞書データを参照しあう。
-    # @param itemData (dict) : 各カラムの値を持った辞書
-    # @return addedItems (list) : QTableWidgetItemのリスト
-    def addItem(self, itemData):
-
-        currentRowCount = self.rowCount()
-        self.setRowCount(currentRowCount+1)
+    ## 設定情報のキーを渡して、カラム番号を返すメソッド。カラムの辞書データをそのまま渡すか、キーを指定する。
+    # サブキーがある場合はサブキーを指定する。
+    # @param colInfo (dict) : 設定情報の各カラムの辞書
+    # @param key (str) : カラムのキー
+    # @param subKey (str) : カラムのサブキー
+    # @return section (int) : カラム番号
+    def getHeaderSectionByKey(self, colInfo = None, key = None, subKey = None):
+        if key is None and subKey is None and colInfo is None:
+            raise ValueError("The arguments, 'colInfo' or 'key', must be supecified.")
 
-        row = currentRowCount
-        addedItems = []
-        for col, colInfo in enumerate(self._config):
+        if colInfo is not None:
+            key = colInfo.get(self.KEY)
+            subKey = colInfo.get(self.SUBKEY)
 
-            try:
-                label = self._setItemCore(colInfo, itemData)
-            except AttributeError:
-                label = ""
+        return self._columnIndex.section(key, subKey)
 
-            item = QTableWidgetItem(label)
-            item.itemData = itemData
-            self.setItem(row, col, item)
-            addedItems.append(item)
 
-        return addedItems
+    #-------------------------------------------------------------------------
+    ## キー、サブキーから現在の表示位置（ビジュアルインデックス）を返すメソッド。
+    # ヘッダーをドラッグして並び替えた後でも、見た目上の列位置を返す。
+    # @param key (str) : カラムのキー
+    # @param subKey (str) : カラムのサブキー [= None]
+    # @return visualIndex (int) : 表示上の列位置
+    def getVisualSectionByKey(self, key, subKey = None):
+        return self.horizontalHeader().visualIndex(self._columnIndex.section(key, subKey))
 
 
     #-------------------------------------------------------------------------
-    ## アイテムデータを更新するメソッド。変更するカラムのキーと値の入った辞書を渡す。
-    # 対応するキーが見つからない場合は何もしない。
-    # また同時にQTableWidgetItemが持っているオリジナルデータも更新するので、QTableWidgetItemを直接
-    # 更新するのではなく、このメソッドを介して更新するほうがよい。
-    # @param itemData (dict) : 各カラムの値を持った辞書
-    # @return addedItems (list) : QTableWidgetItemのリスト
-    def updateItemAt(self, row, itemData):
-        updated = []
-        for col, colInfo in enumerate(self._config):
-            try:
-                label = self._setItemCore(colInfo, itemData)
-            except AttributeError:
-                continue
-            targetItem = self.item(row, col)
-            targetItem.setText(label)
-            targetItem.itemData.update(itemData)
-            updated.append(targetItem)
-
-        return updated
+    ## カラム番号（論理インデックス）からカラムの設定情報を返すメソッド。
+    # @param section (int) : カラム番号
+    # @return colInfo (dict) : カラムの設定情報
+    def getColumnInfoAt(self, section):
+        return self._columnIndex.columnInfo(section)
 
 
     #-------------------------------------------------------------------------
-    ## カラムの設定情報を用いて、itemDataから必要なデータを取り出し、型に合わせて文字列を作成する。
-    # @param colInfo (dict) : テキスト化したいカラムの情報
-    # @param itemData (dict) : 各カラムの値を持った辞書
-    # @return label (str) : カラムの文字列
-    def _setItemCore(self, colInfo, itemData):
-        hKey = colInfo[self.KEY]
-        hType = colInfo[self.TYPE]
+    ## 表示上の列位置（ビジュアルインデックス）からカラムの設定情報を返すメソッド。
+    # @param visualIndex (int) : 表示上の列位置
+    # @return colInfo (dict) : カラムの設定情報
+    def getColumnInfoAtVisual(self, visualIndex):
+        return self._columnIndex.columnInfo(self.horizontalHeader().logicalIndex(visualIndex))
 
-        if not itemData.has_key(hKey):
-            raise AttributeError("Data doesn't have key '%s'." % hKey)
 
-        value = itemData.get(hKey, "")
+    #-------------------------------------------------------------------------
+    ## 現在選択されている行のリストを返す。重複なし。非表示になっている行は含まない。
+    # @return rows (list) : 行番号のリスト。ソートされている。
+    def selectedRows(self):
+        rows = set()
+        for selRange in self.selectionModel().selection():
+            rows.update(range(selRange.top(), selRange.bottom() + 1))
 
-        if hType == "dict":
-            hSubKey = colInfo.get(self.SUBKEY)
-            hSubType = colInfo.get(self.SUBTYPE)
+        return sorted([row for row in rows if not self.isRowHidden(row)])
 
-            if not value.has_key(hSubKey):
-                raise AttributeError("Data doesn't have subKey '%s' of key '%s'." % (hSubKey, hKey))
 
-            subValue = value.get(hSubKey)
-            label = self._makeItemString(subValue, hSubType)
 
-        elif hType == "list" and isinstance(value, list):
-            hSubType = colInfo.get(self.SUBTYPE)
+class ConfigTableWidget(_ConfigTableMixin, QTableWidget):
+    """ConfigTableWidget class
+    テーブルの各カラムの設定を辞書のリストで容易に設定できるテーブル。
+    例）[{'key':'name', 'display':'Name', 'type':'str', 'visible':True, 'width':200}]
+    typeはaddItemに与えるデータの各キーの値の型。'int','bool','str','list','dict'が指定可能。
+    データは階層型辞書でも可（2階層まで）。その際はsubKey、subTypeを指定する。
+    各セルデータの追加も、辞書データを渡すことで対応するキーの値を各カラムに追加できる。
+    追加の処理が必要な場合はサブクラス化し、addItemメソッド等を上書きする。
+    float等の独自のtypeを使う場合は、TYPE_FORMATTERSを拡張するかsetTypeFormatterで変換関数を登録する。
+    'indexed':Trueを指定したカラムは表示文字列の索引を持ち、getItemByValue等の検索が定数時間で行われる。
+    VALUE_SORT_TYPESに含まれるtypeのカラムはセルのQt.DisplayRoleに値そのものをセットし、表示文字列への変換は
+    描画時にデリゲートで行う。ソートは値の大小で、比較ごとにPythonの関数を呼ばずに行われる。
+    行の辞書データは行ごとに1つだけ保持し、先頭カラムのアイテムのQt.UserRoleに持たせた行IDから引く。
+    listのカラムに'listLimit':Nを指定すると、セルには先頭N個の要素と残りの個数だけを表示し、
+    全体はツールチップを表示する際に作成する。
+    'width':'auto'を指定したカラムは、先頭と末尾のAUTO_WIDTH_SAMPLE行、表示中の行、追加時に記録した
+    長い文字列の上位AUTO_WIDTH_LONGEST個だけを計測して幅を決める。'minWidth'、'maxWidth'で幅を制限できる。
+    幅は行の追加に合わせて広がる方向にのみ更新され、ユーザーが手動で幅を変えたカラムは以後更新しない。
+    """
 
-            if hSubType == "dict":
-                hSubKey = colInfo.get(self.SUBKEY)
-                labels = util.makeListByDictKey(hSubKey, value)
-                label = self.SEPARATOR.join(labels)
+    #---------------------------------------------------------------------------
+    ## SIGNALS
+    itemsSynced = Signal(list, list, list)
+    filterApplied = Signal(int)
+    feedProgress = Signal(int)
+    feedFinished = Signal(int)
+    feedCanceled = Signal(int)
+    loadProgress = Signal(int)
+    loadFinished = Signal(int)
+    loadCanceled = Signal(int)
 
-            else:
-                label =self.SEPARATOR.join([self._makeItemString(v, hSubType) for v in value])
+    TYPE    = "type"
+    SUBTYPE = "subType"
+    INDEXED = "indexed"
+    LIST_LIMIT = "listLimit"
+    SEPARATOR = ", "
+    TYPE_FORMATTERS = DEFAULT_TYPE_FORMATTERS
+    VALUE_SORT_TYPES = DEFAULT_VALUE_SORT_TYPES
+    FILTER_DELAY = 150
+    FEED_CHUNK_SIZE = 500
+    FEED_BUDGET_MS = 30
+    LOAD_CHUNK_SIZE = 1000
+    AUTO_WIDTH_SAMPLE = 50
+    AUTO_WIDTH_LONGEST = 8
 
-        else:
-            label = self._makeItemString(value, hType)
 
-        return label
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。テーブル設定データをここで渡す。
+    # @param configuration (list) : list of dict. 詳細はクラスディスクリプションに記述
+    # @param parent (QWidget) : [= None]
+    # @return None
+    def __init__(self, configuration, parent = None):
+        super(ConfigTableWidget, self).__init__(parent)
+        self._initConfig(configuration, parent)
+        self._typeFormatters = dict(self.TYPE_FORMATTERS)
+        self._valueDelegates = {}
+        self.columnFormatters = []
+        self.compileFormatters()
+        self._valueIndexes = dict([(i, {}) for i, colInfo in enumerate(self._config)
+                                   if colInfo.get(self.INDEXED)])
+        self._rowStore = {}
+        self._nextRowId = 0
+        self._primaryKey = None
+        self._rowsByPrimaryKey = {}
+        self._filterText = ""
+        self._filterColumns = None
+        self._filterPredicate = None
+        self._filterMatches = None
+        self._filterCache = {}
+        self._pendingFilter = None
+        self._filterTimer = QTimer(self)
+        self._filterTimer.setSingleShot(True)
+        self._filterTimer.timeout.connect(self._applyFilter)
+        self._sortingSuspendCount = 0
+        self._suspendedSortingEnabled = False
+        self._feedIterator = None
+        self._feedCount = 0
+        self._feedTimer = QTimer(self)
+        self._feedTimer.setSingleShot(True)
+        self._feedTimer.timeout.connect(self._feedStep)
+        self._loadGeneration = 0
+        self._loadChunkCount = 0
+        self._loadNextChunk = 0
+        self._loadCount = 0
+        self._loadPending = {}
+        self._loadTasks = {}
+        self._loadSignals = _RowFormatSignals(self)
+        self._loadSignals.chunkFormatted.connect(self._chunkFormattedEvent)
+        self._initSettings()
+        self.model().rowsAboutToBeRemoved.connect(self._rowsAboutToBeRemovedEvent)
+        self.setSignals()
+        self._setHeaderSetting()
 
 
     #-------------------------------------------------------------------------
-    ## テーブルのアイテムを空にするとともに、行数もリセットする。
+    ## apply initial settings for table view parameters
+    # @param None
+    # @return None
+    def _initSettings(self):
+        self.setColumnCount(len(self._config))
+        self.setHorizontalHeaderLabels(util.makeListByDictKey(self.DISPLAY, self._config))
+        super(ConfigTableWidget, self)._initSettings()
+
+
+    #-------------------------------------------------------------------------
+    ## 'width':'auto'のカラムの中身の幅を計測するメソッド(隠蔽)。先頭と末尾、表示中の行と、
+    # 追加時に記録した長い文字列だけを計測する。
+    # @return widths (dict) : カラム番号と、余白を含めた中身の幅の辞書
+    def _autoWidthContentWidths(self):
+        rows = self._autoWidthSampleRows()
+        metrics = self.fontMetrics()
+
+        widths = {}
+        for col, longestLabels in self._autoWidthColumns.items():
+            width = 0
+            for row in rows:
+                item = self.item(row, col)
+                if item is not None:
+                    width = max(width, metrics.width(self._cellLabel(col, item)))
+            for label in longestLabels:
+                width = max(width, metrics.width(label))
+            widths[col] = width + self.AUTO_WIDTH_PADDING
+
+        return widths
+
+
+    #-------------------------------------------------------------------------
+    ## 幅の計測に使う行番号のリストを返すメソッド(隠蔽)。先頭、末尾、表示中の行。
+    # @return rows (set) : 行番号のセット
+    def _autoWidthSampleRows(self):
+        rowCount = self.rowCount()
+        sample = self.AUTO_WIDTH_SAMPLE
+        rows = set(range(min(sample, rowCount)))
+        rows.update(range(max(0, rowCount - sample), rowCount))
+
+        firstRow = self.rowAt(0)
+        if firstRow >= 0:
+            lastRow = self.rowAt(self.viewport().height() - 1)
+            if lastRow < 0:
+                lastRow = rowCount - 1
+            rows.update(range(firstRow, min(lastRow, firstRow + sample) + 1))
+
+        return rows
+
+
+    #-------------------------------------------------------------------------
+    ## 'width':'auto'のカラムに追加された文字列のうち、長いものを記録するメソッド(隠蔽)。
+    # @param col (int) : カラム番号
+    # @param label (str) : セルの文字列
+    # @return None
+    def _trackAutoWidthLabel(self, col, label):
+        longestLabels = self._autoWidthColumns[col]
+        if len(longestLabels) < self.AUTO_WIDTH_LONGEST:
+            longestLabels.append(label)
+        else:
+            shortest = min(range(len(longestLabels)), key = lambda i: len(longestLabels[i]))
+            if len(label) <= len(longestLabels[shortest]):
+                return
+            longestLabels[shortest] = label
+
+        self._scheduleAutoWidth()
+
+
+    #-------------------------------------------------------------------------
+    ## カラム設定をColumnFormatterのリストにコンパイルしてcolumnFormattersにセットするメソッド。
+    # 設定を変更した場合やtypeの変換関数を変更した場合に呼ぶ。
+    # @param None
+    # @return formatters (list) : カラム順のColumnFormatterのリスト
+    def compileFormatters(self):
+        self.columnFormatters = [ColumnFormatter(colInfo, self._typeFormatters, self.SEPARATOR)
+                                 for colInfo in self._config]
+        self._valueSortColumns = set([col for col, formatter in enumerate(self.columnFormatters)
+                                      if formatter.valueType in self.VALUE_SORT_TYPES])
+        self._setValueDelegates()
+        self._listLimitColumns = set([col for col, formatter in enumerate(self.columnFormatters)
+                                      if formatter.listLimit is not None])
+        self._columnsByKey = {}
+        for col, formatter in enumerate(self.columnFormatters):
+            self._columnsByKey.setdefault(formatter.key, []).append(col)
+        return self.columnFormatters
+
+
+    #-------------------------------------------------------------------------
+    ## 値でソートするカラムに表示文字列へ変換するデリゲートをセットするメソッド(隠蔽)。
+    # @param None
+    # @return None
+    def _setValueDelegates(self):
+        for col in self._valueDelegates.keys():
+            if col not in self._valueSortColumns:
+                self.setItemDelegateForColumn(col, None)
+                del self._valueDelegates[col]
+
+        for col in self._valueSortColumns:
+            if not self._valueDelegates.has_key(col):
+                self._valueDelegates[col] = _ValueFormatDelegate(self, col)
+                self.setItemDelegateForColumn(col, self._valueDelegates[col])
+
+
+    #-------------------------------------------------------------------------
+    ## セルの表示文字列を返すメソッド(隠蔽)。値でソートするカラムのアイテムは値そのものを持っているため、
+    # カラムのColumnFormatterで文字列に変換する。
+    # @param col (int) : 列インデックス
+    # @param item (QTableWidgetItem) : 対象のアイテム
+    # @return label (str) : 表示文字列
+    def _cellLabel(self, col, item):
+        if col in self._valueSortColumns:
+            value = item.data(Qt.DisplayRole)
+            if value is None or value == "":
+                return ""
+            return self.columnFormatters[col].format(value)
+        return item.text()
+
+
+    #-------------------------------------------------------------------------
+    ## typeに対応する値の変換関数を登録するメソッド。登録後、フォーマッターは再コンパイルされる。
+    # 既に追加されているアイテムの文字列は変わらない。
+    # @param typeName (str) : カラム設定のtype、subTypeに指定する名前
+    # @param func (function) : 値を受け取り文字列を返す関数
+    # @return None
+    def setTypeFormatter(self, typeName, func):
+        self._typeFormatters[typeName] = func
+        self.compileFormatters()
+
+
+    #-------------------------------------------------------------------------
+    ## 値を表示用に変換するメソッド
+    # @param value (object) : 値
+    # @param colType (str) : valueのタイプ。(str,string,int,bool)
+    # @return converted (string) : 変換できない場合、空文字列が返る。
+    def _makeItemString(self, value, colType):
+        if value is None:
+            return ""
+
+        func = self._typeFormatters.get(colType)
+        if func is None:
+            return ""
+
+        return func(value)
+
+
+    #-------------------------------------------------------------------------
+    ## 新しくテーブルにアイテムを追加するメソッド。辞書を引数に取り、キーが対応するカラムに値を入れていく。
+    # カラムのデータが取れない場合は空文字列のアイテムが作成される。
+    # オリジナルの辞書データは行ごとに1つだけ保持され、getItemDataAtやgetItemDataで取得できる。
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return addedItems (list) : QTableWidgetItemのリスト
+    def addItem(self, itemData):
+
+        currentRowCount = self.rowCount()
+        self.setRowCount(currentRowCount+1)
+
+        return self._setRowItems(currentRowCount, itemData)
+
+
+    #-------------------------------------------------------------------------
+    ## 複数のアイテムをまとめて追加するメソッド。行数の設定は一度だけ行い、追加中はソート、シグナル、
+    # 描画更新を止めておき、最後に元に戻す（ソートが有効な場合はここで一度だけソートされる）。
+    # @param items (iterable) : 各カラムの値を持った辞書のイテラブル
+    # @return addedRows (list) : 行ごとのQTableWidgetItemのリストのリスト
+    def addItems(self, items):
+        items = list(items)
+        if len(items) == 0:
+            return []
+
+        state = self._suspendUpdates()
+        try:
+            firstRow = self.rowCount()
+            self.setRowCount(firstRow + len(items))
+            addedRows = [self._setRowItems(firstRow + i, itemData) for i, itemData in enumerate(items)]
+        finally:
+            self._resumeUpdates(state)
+
+        return addedRows
+
+
+    #-------------------------------------------------------------------------
+    ## まとめて変更を行う間、ソート、シグナル、描画更新を止めるメソッド(隠蔽)。入れ子で呼んでもよい。
+    # @param None
+    # @return state (tuple) : _resumeUpdatesに渡す変更前の状態
+    def _suspendUpdates(self):
+        state = (self.isSortingEnabled(), self.signalsBlocked(), self.updatesEnabled())
+        self.setSortingEnabled(False)
+        self.blockSignals(True)
+        self.setUpdatesEnabled(False)
+        return state
+
+
+    #-------------------------------------------------------------------------
+    ## _suspendUpdatesで止めた状態を元に戻すメソッド(隠蔽)。ソートが有効だった場合はここで一度だけソートされる。
+    # @param state (tuple) : _suspendUpdatesの戻り値
+    # @return None
+    def _resumeUpdates(self, state):
+        sortingEnabled, signalsBlocked, updatesEnabled = state
+        self.setUpdatesEnabled(updatesEnabled)
+        self.blockSignals(signalsBlocked)
+        self.setSortingEnabled(sortingEnabled)
+
+
+    #-------------------------------------------------------------------------
+    ## feed、loadItemsInBackgroundの間ソートを止めるメソッド(隠蔽)。呼ばれた回数を数え、最初の呼び出しで
+    # ソートの設定を保存する。両方の読み込みが重なっても、_resumeSortingが同じ回数呼ばれた時点で元に戻る。
+    # @return None
+    def _suspendSorting(self):
+        if self._sortingSuspendCount == 0:
+            self._suspendedSortingEnabled = self.isSortingEnabled()
+            self.setSortingEnabled(False)
+        self._sortingSuspendCount += 1
+
+
+    #-------------------------------------------------------------------------
+    ## _suspendSortingで止めたソートを元に戻すメソッド(隠蔽)。最後の呼び出しでのみ設定を戻す。
+    # @return None
+    def _resumeSorting(self):
+        if self._sortingSuspendCount == 0:
+            return
+        self._sortingSuspendCount -= 1
+        if self._sortingSuspendCount == 0:
+            self.setSortingEnabled(self._suspendedSortingEnabled)
+
+
+    #-------------------------------------------------------------------------
+    ## イテラブル（ジェネレータ等）から少しずつ行を追加するメソッド。イベントループ上でchunkSize行ずつ取り出し、
+    # 1回の処理がbudgetMsを超えるまで追加を続けて制御を返すため、UIを止めずに大量のデータを読み込める。
+    # 追加中はソートを止め、終了またはキャンセル時に元に戻す。実行中に再度呼ばれた場合は前の読み込みをキャンセルする。
+    # 進捗はfeedProgress、完了はfeedFinished、キャンセルはfeedCanceledで追加済みの行数と共に通知される。
+    # @param items (iterable) : 各カラムの値を持った辞書のイテラブル
+    # @param chunkSize (int) : [= None] 一度に取り出す行数。NoneでFEED_CHUNK_SIZE
+    # @param budgetMs (int) : [= None] 1回の処理に使う時間の目安(ms)。NoneでFEED_BUDGET_MS
+    # @return None
+    def feed(self, items, chunkSize = None, budgetMs = None):
+        self.cancelFeed()
+
+        self._feedIterator = iter(items)
+        self._feedChunkSize = chunkSize or self.FEED_CHUNK_SIZE
+        if budgetMs is None:
+            budgetMs = self.FEED_BUDGET_MS
+        self._feedBudget = budgetMs / 1000.0
+        self._feedCount = 0
+        self._suspendSorting()
+        self._feedTimer.start(0)
+
+
+    #-------------------------------------------------------------------------
+    ## feedで開始した読み込みを中止するメソッド。既に追加された行はそのまま残る。
+    # @return canceled (bool) : 読み込み中だった場合True
+    def cancelFeed(self):
+        if self._feedIterator is None:
+            return False
+
+        count = self._finishFeed()
+        self.feedCanceled.emit(count)
+        return True
+
+
+    #-------------------------------------------------------------------------
+    ## feedによる読み込み中かどうかを返すメソッド。
+    # @return feeding (bool)
+    def isFeeding(self):
+        return self._feedIterator is not None
+
+
+    #-------------------------------------------------------------------------
+    ## feedの1回分の処理を行うスロット(隠蔽)。時間内に終わらなかった場合は次のイベントループで続きを行う。
+    # @return None
+    def _feedStep(self):
+        iterator = self._feedIterator
+        if iterator is None:
+            return
+
+        startTime = time.time()
+        finished = False
+        try:
+            while True:
+                chunk = list(islice(iterator, self._feedChunkSize))
+                if len(chunk) > 0:
+                    self.addItems(chunk)
+                    self._feedCount += len(chunk)
+                if len(chunk) < self._feedChunkSize:
+                    finished = True
+                    break
+                if time.time() - startTime >= self._feedBudget:
+                    break
+        except Exception:
+            self.cancelFeed()
+            raise
+
+        self.feedProgress.emit(self._feedCount)
+
+        if finished:
+            count = self._finishFeed()
+            self.feedFinished.emit(count)
+        else:
+            self._feedTimer.start(0)
+
+
+    #-------------------------------------------------------------------------
+    ## feedの状態を片付け、ソートの設定を元に戻すメソッド(隠蔽)。
+    # @return count (int) : 追加された行数
+    def _finishFeed(self):
+        self._feedTimer.stop()
+        self._feedIterator = None
+        self._resumeSorting()
+        return self._feedCount
+
+
+    #-------------------------------------------------------------------------
+    ## 行の文字列化を別スレッド（QThreadPool）で行いながら行を追加するメソッド。itemsはchunkSize行ずつの塊に分けて
+    # 文字列化され、GUIスレッドでは文字列化済みの塊を元の順番通りに挿入するだけになる。
+    # 実行中に再度呼ばれた場合は前の読み込みをキャンセルし、古い結果は破棄される。
+    # 追加中はソートを止め、終了またはキャンセル時に元に戻す。
+    # 進捗はloadProgress、完了はloadFinished、キャンセルはloadCanceledで追加済みの行数と共に通知される。
+    # @param items (iterable) : 各カラムの値を持った辞書のイテラブル。最初にGUIスレッドでリスト化される。
+    # @param chunkSize (int) : [= None] 1タスクで文字列化する行数。NoneでLOAD_CHUNK_SIZE
+    # @return None
+    def loadItemsInBackground(self, items, chunkSize = None):
+        self.cancelBackgroundLoad()
+
+        items = list(items)
+        chunkSize = chunkSize or self.LOAD_CHUNK_SIZE
+
+        self._loadGeneration += 1
+        self._loadChunkCount = (len(items) + chunkSize - 1) // chunkSize
+        self._loadNextChunk = 0
+        self._loadCount = 0
+        self._loadPending = {}
+        self._suspendSorting()
+
+        if self._loadChunkCount == 0:
+            self.loadFinished.emit(self._finishBackgroundLoad())
+            return
+
+        pool = QThreadPool.globalInstance()
+        for index in range(self._loadChunkCount):
+            task = _RowFormatTask(self._loadSignals,
+                                  self._formatRow,
+                                  self._currentLoadGeneration,
+                                  self._loadGeneration,
+                                  index,
+                                  items[index * chunkSize:(index + 1) * chunkSize])
+            task.setAutoDelete(False)
+            self._loadTasks[(self._loadGeneration, index)] = task
+            pool.start(task)
+
+
+    #-------------------------------------------------------------------------
+    ## loadItemsInBackgroundで開始した読み込みを中止するメソッド。既に追加された行はそのまま残る。
+    # @return canceled (bool) : 読み込み中だった場合True
+    def cancelBackgroundLoad(self):
+        if not self.isLoadingInBackground():
+            return False
+
+        self._loadGeneration += 1
+        self.loadCanceled.emit(self._finishBackgroundLoad())
+        return True
+
+
+    #-------------------------------------------------------------------------
+    ## loadItemsInBackgroundによる読み込み中かどうかを返すメソッド。
+    # @return loading (bool)
+    def isLoadingInBackground(self):
+        return self._loadNextChunk < self._loadChunkCount
+
+
+    def _currentLoadGeneration(self):
+        return self._loadGeneration
+
+
+    #-------------------------------------------------------------------------
+    ## タスクの文字列化が終わった際にGUIスレッドで呼ばれるスロット(隠蔽)。
+    # 順番が来た塊から挿入し、先の塊が届いた場合は手前の塊が届くまで保留する。
+    # @param generation (int) : タスクの世代番号
+    # @param index (int) : 塊の番号
+    # @param rows (list) : (辞書データ, セルの内容)のリスト。キャンセルされた場合はNone
+    # @return None
+    def _chunkFormattedEvent(self, generation, index, rows):
+        self._loadTasks.pop((generation, index), None)
+        if generation != self._loadGeneration or rows is None:
+            return
+
+        self._loadPending[index] = rows
+        if not self._loadPending.has_key(self._loadNextChunk):
+            return
+
+        while self._loadPending.has_key(self._loadNextChunk):
+            self._insertFormattedRows(self._loadPending.pop(self._loadNextChunk))
+            self._loadNextChunk += 1
+
+        self.loadProgress.emit(self._loadCount)
+
+        if self._loadNextChunk == self._loadChunkCount:
+            self.loadFinished.emit(self._finishBackgroundLoad())
+
+
+    #-------------------------------------------------------------------------
+    ## 文字列化済みの行をまとめて追加するメソッド(隠蔽)。
+    # @param rows (list) : (辞書データ, セルの内容)のリスト
+    # @return None
+    def _insertFormattedRows(self, rows):
+        state = self._suspendUpdates()
+        try:
+            firstRow = self.rowCount()
+            self.setRowCount(firstRow + len(rows))
+            for i, (itemData, cells) in enumerate(rows):
+                self._setFormattedRowItems(firstRow + i, itemData, cells)
+        finally:
+            self._resumeUpdates(state)
+
+        self._loadCount += len(rows)
+
+
+    #-------------------------------------------------------------------------
+    ## 別スレッドでの読み込みの状態を片付け、ソートの設定を元に戻すメソッド(隠蔽)。
+    # @return count (int) : 追加された行数
+    def _finishBackgroundLoad(self):
+        self._loadChunkCount = 0
+        self._loadNextChunk = 0
+        self._loadPending = {}
+        self._resumeSorting()
+        return self._loadCount
+
+
+    #-------------------------------------------------------------------------
+    ## テーブルの内容を全て入れ替えるメソッド。clearAllの後にaddItemsを呼ぶ。
+    # @param items (iterable) : 各カラムの値を持った辞書のイテラブル
+    # @return addedRows (list) : 行ごとのQTableWidgetItemのリストのリスト
+    def setItems(self, items):
+        self.clearAll()
+        return self.addItems(items)
+
+
+    #-------------------------------------------------------------------------
+    ## 指定した行に各カラムのアイテムを作成してセットするメソッド(隠蔽)。行は既に存在している必要がある。
+    # @param row (int) : 行インデックス
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return addedItems (list) : QTableWidgetItemのリスト
+    def _setRowItems(self, row, itemData):
+        return self._setFormattedRowItems(row, itemData, self._formatRow(itemData))
+
+
+    #-------------------------------------------------------------------------
+    ## 行の辞書データから各カラムのセルの内容を作成するメソッド(隠蔽)。GUIには触れないため別スレッドからも呼べる。
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return cells (list) : カラム順の(文字列, 値)のタプルのリスト。値は値でソートするカラム以外はNone
+    def _formatRow(self, itemData):
+        cells = []
+        for col, formatter in enumerate(self.columnFormatters):
+            try:
+                label = formatter(itemData)
+            except AttributeError:
+                label = ""
+
+            if col in self._valueSortColumns and label != "":
+                cells.append((label, formatter.extract(itemData)))
+            else:
+                cells.append((label, None))
+
+        return cells
+
+
+    #-------------------------------------------------------------------------
+    ## _formatRowで作成したセルの内容から、指定した行にアイテムを作成してセットするメソッド(隠蔽)。
+    # @param row (int) : 行インデックス
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @param cells (list) : _formatRowの戻り値
+    # @return addedItems (list) : QTableWidgetItemのリスト
+    def _setFormattedRowItems(self, row, itemData, cells):
+        rowId = self._nextRowId
+        self._nextRowId += 1
+        self._rowStore[rowId] = itemData
+
+        addedItems = []
+        for col, (label, value) in enumerate(cells):
+
+            item = QTableWidgetItem(label)
+            if value is not None:
+                item.setData(Qt.DisplayRole, value)
+            if col == 0:
+                item.setData(Qt.UserRole, rowId)
+            self.setItem(row, col, item)
+            addedItems.append(item)
+
+            if self._autoWidthColumns.has_key(col):
+                self._trackAutoWidthLabel(col, label)
+            if self._valueIndexes.has_key(col):
+                self._addToValueIndex(col, label, item)
+
+        if self._primaryKey is not None and itemData.has_key(self._primaryKey) and len(addedItems) > 0:
+            self._rowsByPrimaryKey[itemData[self._primaryKey]] = addedItems[0]
+
+        if self._filterMatches is not None and len(addedItems) > 0:
+            self._refilterRow(row)
+
+        return addedItems
+
+
+    #-------------------------------------------------------------------------
+    ## アイテムデータを更新するメソッド。変更するカラムのキーと値の入った辞書を渡す。
+    # 対応するキーが見つからない場合は何もしない。
+    # また同時に行のオリジナルデータも更新するので、QTableWidgetItemを直接
+    # 更新するのではなく、このメソッドを介して更新するほうがよい。
+    # itemDataに含まれるキーのカラムのみ文字列化し直す。
+    # 更新中はソートを止めるため、行番号は変わらない。ソートは最後に一度だけ行われる。
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return addedItems (list) : QTableWidgetItemのリスト
+    def updateItemAt(self, row, itemData):
+        keyItem = self.item(row, 0)
+        if keyItem is None:
+            return []
+        rowData = self._rowStore[keyItem.data(Qt.UserRole)]
+
+        updated = []
+        state = self._suspendUpdates()
+        try:
+            for col in self._columnsForKeys(itemData):
+                try:
+                    label = self.columnFormatters[col](itemData)
+                except AttributeError:
+                    continue
+                targetItem = self.item(row, col)
+                self._setItemText(col, targetItem, label, itemData)
+                updated.append(targetItem)
+
+            if len(updated) > 0:
+                self._updateRowData(rowData, itemData, replace = False)
+                self._refilterRow(row)
+        finally:
+            self._resumeUpdates(state)
+
+        return updated
+
+
+    #-------------------------------------------------------------------------
+    ## 辞書のキーに対応するカラム番号のリストを返すメソッド(隠蔽)。
+    # @param itemData (dict) : 辞書
+    # @return columns (list) : カラム番号のリスト。昇順に並んでいる。
+    def _columnsForKeys(self, itemData):
+        columns = []
+        for key in itemData:
+            columns.extend(self._columnsByKey.get(key, []))
+        return sorted(columns)
+
+
+    #-------------------------------------------------------------------------
+    ## 主キーを用いて、渡された辞書のリストとテーブルの内容を同期するメソッド。
+    # テーブルに無い主キーの行は追加し、渡されなかった主キーの行は削除する。両方にある行は
+    # 表示文字列が変わったセルのみ更新する。変更後にitemsSyncedシグナルを一度だけ発行する。
+    # 新しい行はitemsの順に末尾へ追加され、削除する行は連続した範囲ごとにまとめて削除される。
+    # @param items (iterable) : 各カラムの値を持った辞書のイテラブル
+    # @param primaryKey (str) : [= "id"] 行を特定するためのキー
+    # @return changes (tuple) : (追加, 更新, 削除)された主キーのリストのタプル
+    def syncItems(self, items, primaryKey = "id"):
+        self._setPrimaryKey(primaryKey)
+
+        incoming = OrderedDict()
+        for itemData in items:
+            incoming[itemData[primaryKey]] = itemData
+
+        rowsByKey = self._primaryKeyRows()
+        added = []
+        updated = []
+        removed = []
+        removedRows = []
+
+        state = self._suspendUpdates()
+        try:
+            for pk, row in rowsByKey:
+                itemData = incoming.get(pk)
+                if itemData is None:
+                    removed.append(pk)
+                    removedRows.append(row)
+                elif self._syncRow(row, self._rowStore[self.item(row, 0).data(Qt.UserRole)], itemData):
+                    updated.append(pk)
+
+            self._removeRowBlocks(removedRows)
+
+            newItems = []
+            for pk, itemData in incoming.items():
+                if not self._rowsByPrimaryKey.has_key(pk):
+                    newItems.append(itemData)
+                    added.append(pk)
+
+            self.addItems(newItems)
+        finally:
+            self._resumeUpdates(state)
+
+        self.itemsSynced.emit(added, updated, removed)
+        return (added, updated, removed)
+
+
+    #-------------------------------------------------------------------------
+    ## 主キーの索引に登録されている行の(主キー, 行番号)のリストを返すメソッド(隠蔽)。
+    # QTableWidgetItem.row()はテーブルを線形に探すため、先頭カラムを一度だけ走査して行番号を得る。
+    # @return rows (list) : 行順に並んだ(主キー, 行番号)のタプルのリスト
+    def _primaryKeyRows(self):
+        rows = []
+        for row in range(self.rowCount()):
+            keyItem = self.item(row, 0)
+            if keyItem is None:
+                continue
+            rowData = self._rowStore.get(keyItem.data(Qt.UserRole))
+            if rowData is None or not rowData.has_key(self._primaryKey):
+                continue
+            pk = rowData[self._primaryKey]
+            if self._rowsByPrimaryKey.get(pk) is keyItem:
+                rows.append((pk, row))
+        return rows
+
+
+    #-------------------------------------------------------------------------
+    ## 行をまとめて削除するメソッド(隠蔽)。連続した行は一度のremoveRowsで、後ろの範囲から削除する。
+    # @param rows (list) : 削除する行番号のリスト。昇順に並んでいる。
+    # @return None
+    def _removeRowBlocks(self, rows):
+        model = self.model()
+        end = len(rows)
+        while end > 0:
+            start = end - 1
+            while start > 0 and rows[start - 1] == rows[start] - 1:
+                start -= 1
+            model.removeRows(rows[start], end - start)
+            end = start
+
+
+    #-------------------------------------------------------------------------
+    ## 既存の行を新しい辞書データの内容に合わせるメソッド(隠蔽)。文字列が変わったセルのみ更新する。
+    # @param row (int) : 行インデックス
+    # @param rowData (dict) : 行の辞書データ
+    # @param itemData (dict) : 新しい辞書データ
+    # @return changed (bool) : 辞書データに変更があった場合True
+    def _syncRow(self, row, rowData, itemData):
+        if rowData is not itemData and rowData == itemData:
+            return False
+
+        changed = rowData is not itemData
+        for col, formatter in enumerate(self.columnFormatters):
+            try:
+                label = formatter(itemData)
+            except AttributeError:
+                label = ""
+            targetItem = self.item(row, col)
+            if self._cellLabel(col, targetItem) != label:
+                self._setItemText(col, targetItem, label, itemData)
+                changed = True
+
+        self._updateRowData(rowData, itemData, replace = True)
+        if changed:
+            self._refilterRow(row)
+        return changed
+
+
+    #-------------------------------------------------------------------------
+    ## アイテムのテキストを変更し、値の索引も更新するメソッド(隠蔽)。
+    # 値でソートするカラムの場合は文字列の代わりに値をQt.DisplayRoleにセットする。
+    # @param col (int) : 列インデックス
+    # @param item (QTableWidgetItem) : 対象のアイテム
+    # @param label (str) : 新しいテキスト
+    # @param itemData (dict) : labelの元になった辞書
+    # @return None
+    def _setItemText(self, col, item, label, itemData):
+        if self._valueIndexes.has_key(col):
+            self._removeFromValueIndex(col, self._cellLabel(col, item), item)
+            self._addToValueIndex(col, label, item)
+        if self._autoWidthColumns.has_key(col):
+            self._trackAutoWidthLabel(col, label)
+
+        if col in self._valueSortColumns and label != "":
+            item.setData(Qt.DisplayRole, self.columnFormatters[col].extract(itemData))
+        else:
+            item.setText(label)
+
+
+    #-------------------------------------------------------------------------
+    ## 行の辞書データを更新するメソッド(隠蔽)。主キーの索引も合わせて更新する。
+    # @param rowData (dict) : 行の辞書データ
+    # @param itemData (dict) : 新しい値の入った辞書
+    # @param replace (bool) : Trueの場合は内容を丸ごと入れ替える。Falseの場合はupdateする。
+    # @return None
+    def _updateRowData(self, rowData, itemData, replace):
+        if rowData is itemData:
+            return
+
+        pk = self._primaryKey
+        if pk is not None and itemData.has_key(pk) and rowData.get(pk) != itemData[pk]:
+            keyItem = self._rowsByPrimaryKey.pop(rowData.get(pk), None)
+            if keyItem is not None:
+                self._rowsByPrimaryKey[itemData[pk]] = keyItem
+
+        if replace:
+            rowData.clear()
+        rowData.update(itemData)
+
+
+    #-------------------------------------------------------------------------
+    ## 主キーを設定し、主キーから行の先頭アイテムを引く索引を作成するメソッド(隠蔽)。
+    # 同じ主キーが設定済みの場合は何もしない。以降の行の追加、削除に合わせて索引は更新される。
+    # @param primaryKey (str) : 行を特定するためのキー
+    # @return None
+    def _setPrimaryKey(self, primaryKey):
+        if self._primaryKey == primaryKey:
+            return
+
+        self._primaryKey = primaryKey
+        self._rowsByPrimaryKey = {}
+        for row in range(self.rowCount()):
+            keyItem = self.item(row, 0)
+            if keyItem is None:
+                continue
+            rowData = self._rowStore.get(keyItem.data(Qt.UserRole))
+            if rowData is not None and rowData.has_key(primaryKey):
+                self._rowsByPrimaryKey[rowData[primaryKey]] = keyItem
+
+
+    #-------------------------------------------------------------------------
+    ## カラムの設定情報を用いて、itemDataから必要なデータを取り出し、型に合わせて文字列を作成する。
+    # @param colInfo (dict) : テキスト化したいカラムの情報
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return label (str) : カラムの文字列
+    def _setItemCore(self, colInfo, itemData):
+        return ColumnFormatter(colInfo, self._typeFormatters, self.SEPARATOR)(itemData)
+
+
+    #-------------------------------------------------------------------------
+    ## テーブルのアイテムを空にするとともに、行数もリセットする。
     # @param None
     # @return None
     def clearAll(self):
+        for col in self._valueIndexes.keys():
+            self._valueIndexes[col] = {}
+        self._rowStore = {}
+        for col in self._autoWidthColumns.keys():
+            self._autoWidthColumns[col] = []
+        self._rowsByPrimaryKey = {}
+        self._filterCache = {}
+        if self._filterMatches is not None:
+            self._filterMatches = set()
         self.clearContents()
         self.setRowCount(0)
 
 
     #-------------------------------------------------------------------------
-    ## 現在選択されている行のリストを返す。重複なし。
-    # @return rows (list) : 行番号のリスト。ソートされている。
-    def selectedRows(self):
-        sels = self.selectedItems()
-        rows = set()
-        for selItem in sels:
-            rows.add(selItem.row())
+    ## 現在選択されている行の辞書データのリストを返す。表示文字列を介さずaddItemに渡した辞書をそのまま返す。
+    # @return itemDataList (list) : 辞書データのリスト。行順に並んでいる。
+    def selectedItemData(self):
+        itemDataList = []
+        for row in self.selectedRows():
+            keyItem = self.item(row, 0)
+            if keyItem is not None:
+                itemDataList.append(self._rowStore.get(keyItem.data(Qt.UserRole)))
 
-        return sorted(list(rows))
+        return itemDataList
 
 
     #-------------------------------------------------------------------------
@@ -276,16 +1425,17 @@ class ConfigTableWidget(QTableWidget):
             raise ValueError
 
         resList = set()
-        sels = self.selectedItems()
-        for selItem in sels:
-            itemRow = selItem.row()
+        for itemRow in self.selectedRows():
             keyItem = self.item(itemRow, keyCol)
+            if keyItem is None:
+                continue
+            label = self._cellLabel(keyCol, keyItem)
             if valType == "int":
-                value = int(keyItem.text())
-            elif valType in ("str" or "string"):
-                value = str(keyItem.text())
+                value = int(label)
+            elif valType in ("str", "string"):
+                value = str(label)
             else:
-                value = keyItem.text()
+                value = label
 
             resList.add(value)
 
@@ -310,23 +1460,699 @@ class ConfigTableWidget(QTableWidget):
     def getItemDataAt(self, row):
         item = self.item(row, 0)
         try:
-            return item.itemData
+            return self._rowStore[item.data(Qt.UserRole)]
         except Exception as err:
             raise err
 
 
+    #-------------------------------------------------------------------------
+    ## アイテムが属する行のデータを取得するメソッド。
+    # @param item (QTableWidgetItem) : テーブルのアイテム
+    # @return itemData (dict) : 行を作る際に用いた辞書データ。見つからない場合はNone
+    def getItemData(self, item):
+        if item.column() != 0:
+            item = self.item(item.row(), 0)
+            if item is None:
+                return None
+
+        return self._rowStore.get(item.data(Qt.UserRole))
+
+
+    #-------------------------------------------------------------------------
+    ## 行の辞書データから作ったセルの表示文字列を返すメソッド。セルのアイテムが表示文字列そのものを
+    # 保持しているため、辞書データから文字列化し直さずに返す。値でソートするカラムはセルの値から変換する。
+    # サブクラスで表示用に文字列を使う場合に用いる。
+    # @param row (int) : 行インデックス
+    # @param col (int) : 列インデックス
+    # @return label (str) : セルの文字列
+    def getFormattedValueAt(self, row, col):
+        item = self.item(row, col)
+        if item is None:
+            return ""
+        return self._cellLabel(col, item)
+
+
+    #-------------------------------------------------------------------------
+    ## セルの省略されていない文字列を返すメソッド。listLimitを指定したカラムでも全要素を連結した文字列が返る。
+    # @param row (int) : 行インデックス
+    # @param col (int) : 列インデックス
+    # @return label (str) : セルの文字列
+    def getFullTextAt(self, row, col):
+        formatter = self.columnFormatters[col]
+        try:
+            return formatter.formatFull(formatter.extract(self.getItemDataAt(row)))
+        except AttributeError:
+            return ""
+
+
+    #-------------------------------------------------------------------------
+    ## viewportEventのオーバーライド。listLimitを指定したカラムのツールチップに、省略されていない文字列を表示する。
+    # 全体の文字列はツールチップを表示する時にだけ作成される。
+    # @param event (QEvent) : イベントオブジェクト
+    # @return handled (bool)
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip and len(self._listLimitColumns) > 0:
+            item = self.itemAt(event.pos())
+            if item is not None and item.column() in self._listLimitColumns:
+                QToolTip.showText(event.globalPos(), self.getFullTextAt(item.row(), item.column()), self.viewport())
+                return True
+
+        return super(ConfigTableWidget, self).viewportEvent(event)
+
+
     #-------------------------------------------------------------------------
     ## 列アイテムの中で指定した値を持つアイテムを取得する。見つからなかった場合はNoneが返る。
     # @param col (int) : 列インデックス
     # @param value (str or unicode)
     # @return item (QTableWidgetItem)
     def getItemByValue(self, col, value):
+        items = self.getItemsByValue(col, value)
+        if len(items) == 0:
+            return None
+        return items[0]
+
+
+    #-------------------------------------------------------------------------
+    ## 列アイテムの中で指定した値を持つアイテムを全て取得する。索引が有効なカラムは索引を使って検索する。
+    # @param col (int) : 列インデックス
+    # @param value (str or unicode)
+    # @return items (list) : QTableWidgetItemのリスト。行順に並んでいる。
+    def getItemsByValue(self, col, value):
+        if self._valueIndexes.has_key(col):
+            items = self._valueIndexes[col].get(value, [])
+            if len(items) <= 1:
+                return list(items)
+            return self._itemsInRowOrder(col, items)
+
+        items = []
         for row in range(self.rowCount()):
             item = self.item(row, col)
             if item is None:
                 continue
-            if item.text() == value:
-                return item
+            if self._cellLabel(col, item) == value:
+                items.append(item)
+        return items
+
+
+    #-------------------------------------------------------------------------
+    ## カラムの値の索引を有効にするメソッド。既に追加されているアイテムもここで索引に登録される。
+    # 索引はaddItem、updateItemAt、行の削除、clearAllに合わせて更新される。アイテムのテキストを
+    # 直接変更した場合は索引に反映されないため、updateItemAtを使うこと。
+    # @param key (str) : カラム設定のキー
+    # @param subKey (str) : カラム設定のサブキー [= None]
+    # @return None
+    def enableIndex(self, key, subKey = None):
+        col = self.getHeaderSectionByKey(key = key, subKey = subKey)
+        self._valueIndexes[col] = {}
+        for row in range(self.rowCount()):
+            item = self.item(row, col)
+            if item is not None:
+                self._addToValueIndex(col, self._cellLabel(col, item), item)
+
+
+    #-------------------------------------------------------------------------
+    ## カラムの値の索引を無効にするメソッド。
+    # @param key (str) : カラム設定のキー
+    # @param subKey (str) : カラム設定のサブキー [= None]
+    # @return None
+    def disableIndex(self, key, subKey = None):
+        col = self.getHeaderSectionByKey(key = key, subKey = subKey)
+        self._valueIndexes.pop(col, None)
+
+
+    #-------------------------------------------------------------------------
+    ## アイテムのリストを行順に並べて返すメソッド(隠蔽)。QTableWidgetItem.row()はテーブルを線形に探すため、
+    # アイテムごとに呼ばず、カラムを一度だけ先頭から走査する。全て見つかった時点で走査をやめる。
+    # @param col (int) : 列インデックス
+    # @param items (list) : 同じカラムのQTableWidgetItemのリスト
+    # @return items (list) : QTableWidgetItemのリスト。行順に並んでいる。
+    def _itemsInRowOrder(self, col, items):
+        remaining = set([id(item) for item in items])
+        ordered = []
+        for row in range(self.rowCount()):
+            item = self.item(row, col)
+            if item is not None and id(item) in remaining:
+                ordered.append(item)
+                remaining.discard(id(item))
+                if len(remaining) == 0:
+                    break
+        return ordered
+
+
+    def _addToValueIndex(self, col, value, item):
+        self._valueIndexes[col].setdefault(value, []).append(item)
+
+
+    def _removeFromValueIndex(self, col, value, item):
+        items = self._valueIndexes[col].get(value)
+        if items is None:
+            return
+        for i, indexed in enumerate(items):
+            if indexed is item:
+                del items[i]
+                break
+        if len(items) == 0:
+            del self._valueIndexes[col][value]
+
+
+    #-------------------------------------------------------------------------
+    ## 行が削除される直前に呼ばれるスロット(隠蔽)。削除される行のアイテムを索引と行データから取り除く。
+    # @param parent (QModelIndex)
+    # @param first (int) : 削除される最初の行
+    # @param last (int) : 削除される最後の行
+    # @return None
+    def _rowsAboutToBeRemovedEvent(self, parent, first, last):
+        if self._primaryKey is not None:
+            for row in range(first, last + 1):
+                keyItem = self.item(row, 0)
+                if keyItem is None:
+                    continue
+                rowData = self._rowStore.get(keyItem.data(Qt.UserRole))
+                if rowData is None:
+                    continue
+                pk = rowData.get(self._primaryKey)
+                if self._rowsByPrimaryKey.get(pk) is keyItem:
+                    del self._rowsByPrimaryKey[pk]
+
+        for col in self._valueIndexes.keys():
+            for row in range(first, last + 1):
+                item = self.item(row, col)
+                if item is not None:
+                    self._removeFromValueIndex(col, self._cellLabel(col, item), item)
+
+        if len(self._filterCache) > 0 or self._filterMatches is not None:
+            for row in range(first, last + 1):
+                keyItem = self.item(row, 0)
+                self._filterCache.pop(keyItem, None)
+                if self._filterMatches is not None:
+                    self._filterMatches.discard(keyItem)
+
+        for row in range(first, last + 1):
+            keyItem = self.item(row, 0)
+            if keyItem is not None:
+                self._rowStore.pop(keyItem.data(Qt.UserRole), None)
+
+
+    #-------------------------------------------------------------------------
+    ## 行の絞り込みを設定するメソッド。textを含む行（大文字小文字は区別しない）のみを表示する。
+    # 連続して呼ばれた場合はdelayミリ秒後に最後の条件だけが適用される。前回の文字列を含む文字列で
+    # 絞り込む場合（文字を打ち足した場合）は、前回表示されていた行のみを再判定する。
+    # @param text (str) : 検索文字列。空文字列の場合は文字列による絞り込みを行わない。
+    # @param keys (list) : [= None] 検索対象のカラムのキー、または(key, subKey)のタプルのリスト。Noneの場合は全カラム。
+    # @param predicate (function) : [= None] 行の辞書データを受け取り、表示する場合にTrueを返す関数
+    # @param delay (int) : [= None] 適用までの待ち時間(ms)。NoneでFILTER_DELAY、0で即時適用。
+    # @return None
+    def setFilter(self, text, keys = None, predicate = None, delay = None):
+        if keys is None:
+            columns = None
+        else:
+            columns = []
+            for key in keys:
+                if isinstance(key, tuple):
+                    columns.append(self.getHeaderSectionByKey(key = key[0], subKey = key[1]))
+                else:
+                    columns.append(self.getHeaderSectionByKey(key = key))
+
+        self._pendingFilter = (text.lower(), columns, predicate)
+        if delay is None:
+            delay = self.FILTER_DELAY
+
+        if delay <= 0:
+            self._filterTimer.stop()
+            self._applyFilter()
+        else:
+            self._filterTimer.start(delay)
+
+
+    #-------------------------------------------------------------------------
+    ## 絞り込みを解除して全ての行を表示するメソッド。
+    # @return None
+    def clearFilter(self):
+        self.setFilter("", delay = 0)
+
+
+    #-------------------------------------------------------------------------
+    ## 現在適用されている絞り込みの文字列を返すメソッド。
+    # @return text (str) : 小文字に変換された検索文字列
+    def filterText(self):
+        return self._filterText
+
+
+    #-------------------------------------------------------------------------
+    ## setFilterで設定された条件を適用するメソッド(隠蔽)。タイマーから呼ばれる。
+    # @return None
+    def _applyFilter(self):
+        if self._pendingFilter is None:
+            return
+
+        text, columns, predicate = self._pendingFilter
+        self._pendingFilter = None
+
+        sameScope = (columns == self._filterColumns and predicate is self._filterPredicate)
+        if columns != self._filterColumns:
+            self._filterCache = {}
+        narrowing = (sameScope and self._filterMatches is not None and self._filterText in text)
+
+        self._filterText = text
+        self._filterColumns = columns
+        self._filterPredicate = predicate
+
+        state = self._suspendUpdates()
+        try:
+            if text == "" and predicate is None:
+                if self._filterMatches is not None:
+                    for row in range(self.rowCount()):
+                        if self.isRowHidden(row):
+                            self.setRowHidden(row, False)
+                self._filterMatches = None
+                visibleCount = self.rowCount()
+
+            elif narrowing:
+                previousMatches = self._filterMatches
+                matches = set()
+                for row in range(self.rowCount()):
+                    keyItem = self.item(row, 0)
+                    if keyItem is None or keyItem not in previousMatches:
+                        continue
+                    if self._matchesFilter(row, keyItem):
+                        matches.add(keyItem)
+                    else:
+                        self.setRowHidden(row, True)
+                self._filterMatches = matches
+                visibleCount = len(matches)
+
+            else:
+                matches = set()
+                for row in range(self.rowCount()):
+                    keyItem = self.item(row, 0)
+                    matched = keyItem is not None and self._matchesFilter(row, keyItem)
+                    if matched:
+                        matches.add(keyItem)
+                    if self.isRowHidden(row) == matched:
+                        self.setRowHidden(row, not matched)
+                self._filterMatches = matches
+                visibleCount = len(matches)
+        finally:
+            self._resumeUpdates(state)
+
+        self.filterApplied.emit(visibleCount)
+
+
+    #-------------------------------------------------------------------------
+    ## 行が現在の絞り込み条件に一致するかを返すメソッド(隠蔽)。検索対象の文字列は行ごとにキャッシュする。
+    # QTableWidgetItem.row()はテーブルを線形に探すため、行番号は呼び出し側から渡す。
+    # @param row (int) : 行インデックス
+    # @param keyItem (QTableWidgetItem) : 行の先頭カラムのアイテム
+    # @return matched (bool)
+    def _matchesFilter(self, row, keyItem):
+        if self._filterText != "":
+            searchText = self._filterCache.get(keyItem)
+            if searchText is None:
+                columns = self._filterColumns
+                if columns is None:
+                    columns = range(self.columnCount())
+                labels = []
+                for col in columns:
+                    item = self.item(row, col)
+                    if item is not None:
+                        labels.append(self._cellLabel(col, item))
+                searchText = "\n".join(labels).lower()
+                self._filterCache[keyItem] = searchText
+
+            if self._filterText not in searchText:
+                return False
+
+        if self._filterPredicate is not None and\
+           not self._filterPredicate(self._rowStore.get(keyItem.data(Qt.UserRole))):
+            return False
+
+        return True
+
+
+    #-------------------------------------------------------------------------
+    ## 内容が変わった行を絞り込み条件で再判定するメソッド(隠蔽)。
+    # @param row (int) : 行インデックス
+    # @return None
+    def _refilterRow(self, row):
+        keyItem = self.item(row, 0)
+        if keyItem is None:
+            return
+
+        self._filterCache.pop(keyItem, None)
+        if self._filterMatches is None:
+            return
+
+        matched = self._matchesFilter(row, keyItem)
+        if matched:
+            self._filterMatches.add(keyItem)
+        else:
+            self._filterMatches.discard(keyItem)
+        if self.isRowHidden(row) == matched:
+            self.setRowHidden(row, not matched)
+
+
+
+
+class ConfigTableModel(QAbstractTableModel):
+    """ConfigTableModel class
+    ConfigTableWidgetと同じカラム設定を受け取るテーブルモデル。
+    データはカラムごとの配列に値のまま保持し、表示用の文字列はdata()が呼ばれた時
+    （＝表示されている行のみ）に作成する。QTableWidgetItemを行×列分作らないため、
+    大量の行を扱う場合のメモリ使用量とロード時間を抑えられる。
+    """
+
+    KEY     = ConfigTableWidget.KEY
+    SUBKEY  = ConfigTableWidget.SUBKEY
+    DISPLAY = ConfigTableWidget.DISPLAY
+    TYPE    = ConfigTableWidget.TYPE
+    SUBTYPE = ConfigTableWidget.SUBTYPE
+    SEPARATOR = ConfigTableWidget.SEPARATOR
+    TYPE_FORMATTERS = DEFAULT_TYPE_FORMATTERS
+    VALUE_SORT_TYPES = DEFAULT_VALUE_SORT_TYPES
+
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。
+    # @param configuration (list) : list of dict. ConfigTableWidgetと同じ形式
+    # @param parent (QObject) : [= None]
+    # @return None
+    def __init__(self, configuration, parent = None):
+        super(ConfigTableModel, self).__init__(parent)
+        self._config = configuration
+        self._typeFormatters = dict(self.TYPE_FORMATTERS)
+        self.columnFormatters = []
+        self.compileFormatters()
+        self._columns = [[] for colInfo in self._config]
+        self._rowData = []
+        self._rowIds = []
+        self._nextRowId = 0
+        self._labelCache = FormattedValueCache()
+
+
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rowData)
+
+
+    def columnCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._config)
+
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == Qt.DisplayRole:
+            row = index.row()
+            col = index.column()
+            rowId = self._rowIds[row]
+            label = self._labelCache.lookup(rowId, col)
+            if label is None:
+                label = self.columnFormatters[col].format(self._columns[col][row])
+                self._labelCache.store(rowId, col, label)
+            return label
+
+        if role == Qt.ToolTipRole:
+            formatter = self.columnFormatters[index.column()]
+            if formatter.listLimit is not None:
+                return formatter.formatFull(self._columns[index.column()][index.row()])
+
         return None
 
 
+    def headerData(self, section, orientation, role = Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self._config[section].get(self.DISPLAY, "")
+
+        return super(ConfigTableModel, self).headerData(section, orientation, role)
+
+
+    #---------------------------------------------------------------------------
+    ## ソートのオーバーライド。各カラム配列を同じ並び順で入れ替える。
+    # VALUE_SORT_TYPESに含まれるtypeのカラムは値の配列そのものを、それ以外は表示文字列の配列をキーにして
+    # 一度だけソートする。比較ごとにPythonの関数は呼ばれない。
+    # @param column (int) : カラム番号
+    # @param order (Qt.SortOrder) : [= Qt.AscendingOrder]
+    # @return None
+    def sort(self, column, order = Qt.AscendingOrder):
+        if column < 0 or column >= len(self._config):
+            return
+
+        rowOrder = sorted(range(len(self._rowData)),
+                          key = self._sortKeys(column).__getitem__,
+                          reverse = (order == Qt.DescendingOrder))
+        self._applyRowOrder(rowOrder)
+
+
+    #---------------------------------------------------------------------------
+    ## ソートに使うキーの配列を返すメソッド(隠蔽)。
+    # @param column (int) : カラム番号
+    # @return keys (list) : 行順に並んだソートキーのリスト
+    def _sortKeys(self, column):
+        formatter = self.columnFormatters[column]
+        if formatter.valueType in self.VALUE_SORT_TYPES:
+            return [(value is not None, value) for value in self._columns[column]]
+
+        formatValue = formatter.format
+        return [formatValue(value) for value in self._columns[column]]
+
+
+    #---------------------------------------------------------------------------
+    ## 行の並び順を適用するメソッド(隠蔽)。永続インデックスも新しい位置に付け替える。
+    # @param rowOrder (list) : 新しい並び順で並べた旧行番号のリスト
+    # @return None
+    def _applyRowOrder(self, rowOrder):
+        self.layoutAboutToBeChanged.emit()
+
+        for col, values in enumerate(self._columns):
+            self._columns[col] = [values[row] for row in rowOrder]
+        self._rowData = [self._rowData[row] for row in rowOrder]
+        self._rowIds = [self._rowIds[row] for row in rowOrder]
+
+        newRows = [0] * len(rowOrder)
+        for newRow, oldRow in enumerate(rowOrder):
+            newRows[oldRow] = newRow
+
+        oldIndexes = self.persistentIndexList()
+        newIndexes = [self.index(newRows[idx.row()], idx.column()) for idx in oldIndexes]
+        self.changePersistentIndexList(oldIndexes, newIndexes)
+
+        self.layoutChanged.emit()
+
+
+    #---------------------------------------------------------------------------
+    ## カラム設定をColumnFormatterのリストにコンパイルするメソッド。
+    # @param None
+    # @return formatters (list) : カラム順のColumnFormatterのリスト
+    def compileFormatters(self):
+        self.columnFormatters = [ColumnFormatter(colInfo, self._typeFormatters, self.SEPARATOR)
+                                 for colInfo in self._config]
+        self._columnsByKey = {}
+        for col, formatter in enumerate(self.columnFormatters):
+            self._columnsByKey.setdefault(formatter.key, []).append(col)
+        return self.columnFormatters
+
+
+    #---------------------------------------------------------------------------
+    ## typeに対応する値の変換関数を登録するメソッド。文字列はdata()で作られるため、既存の行にも反映される。
+    # @param typeName (str) : カラム設定のtype、subTypeに指定する名前
+    # @param func (function) : 値を受け取り文字列を返す関数
+    # @return None
+    def setTypeFormatter(self, typeName, func):
+        self._typeFormatters[typeName] = func
+        self.compileFormatters()
+        self._labelCache.clear()
+        if len(self._rowData) > 0:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(len(self._rowData) - 1, len(self._config) - 1))
+
+
+    #---------------------------------------------------------------------------
+    ## フォーマッターでitemDataからセルの値を取り出す(隠蔽)。取り出せない場合はNoneを返す。
+    # @param formatter (ColumnFormatter) : カラムのフォーマッター
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return value (object) : セルの値
+    def _extractValue(self, formatter, itemData):
+        try:
+            return formatter.extract(itemData)
+        except AttributeError:
+            return None
+
+
+    #---------------------------------------------------------------------------
+    ## 新しく行を追加するメソッド。
+    # @param itemData (dict) : 各カラムの値を持った辞書
+    # @return row (int) : 追加された行番号
+    def addItem(self, itemData):
+        return self.addItems([itemData])[0]
+
+
+    #---------------------------------------------------------------------------
+    ## 複数の行をまとめて追加するメソッド。rowsInsertedは一度だけ発行される。
+    # @param items (iterable) : 辞書のイテラブル
+    # @return rows (list) : 追加された行番号のリスト
+    def addItems(self, items):
+        items = list(items)
+        if len(items) == 0:
+            return []
+
+        first = len(self._rowData)
+        last = first + len(items) - 1
+        self.beginInsertRows(QModelIndex(), first, last)
+        for col, formatter in enumerate(self.columnFormatters):
+            self._columns[col].extend([self._extractValue(formatter, itemData) for itemData in items])
+        self._rowData.extend(items)
+        self._rowIds.extend(range(self._nextRowId, self._nextRowId + len(items)))
+        self._nextRowId += len(items)
+        self.endInsertRows()
+
+        return range(first, last + 1)
+
+
+    #---------------------------------------------------------------------------
+    ## 行データを更新するメソッド。itemDataに含まれるキーのカラムのみ更新され、表示文字列のキャッシュも
+    # そのカラムの分だけ破棄される。
+    # @param row (int) : 行番号
+    # @param itemData (dict) : 変更するカラムのキーと値の入った辞書
+    # @return columns (list) : 更新されたカラム番号のリスト
+    def updateItemAt(self, row, itemData):
+        rowData = self._rowData[row]
+        rowData.update(itemData)
+
+        updated = []
+        for key in itemData:
+            for col in self._columnsByKey.get(key, []):
+                self._columns[col][row] = self._extractValue(self.columnFormatters[col], rowData)
+                updated.append(col)
+        self._labelCache.invalidate(self._rowIds[row], updated)
+
+        if len(updated) > 0:
+            self.dataChanged.emit(self.index(row, min(updated)), self.index(row, max(updated)))
+
+        return updated
+
+
+    #---------------------------------------------------------------------------
+    ## 全ての行を削除するメソッド。
+    # @return None
+    def clearAll(self):
+        self.beginResetModel()
+        self._columns = [[] for colInfo in self._config]
+        self._rowData = []
+        self._rowIds = []
+        self._labelCache.clear()
+        self.endResetModel()
+
+
+    #---------------------------------------------------------------------------
+    ## ある行におけるデータを全て取得するメソッド。
+    # @param row (int) : 行インデックス
+    # @return itemData (dict) : 行を作る際に用いた辞書データ
+    def getItemDataAt(self, row):
+        return self._rowData[row]
+
+
+    #---------------------------------------------------------------------------
+    ## 表示文字列のキャッシュを返すメソッド。stats()でヒット数、ミス数を確認できる。
+    # @return cache (FormattedValueCache)
+    def labelCache(self):
+        return self._labelCache
+
+
+    #---------------------------------------------------------------------------
+    ## カラムの設定データを返すメソッド。
+    # @return configuration (list) : list of dict
+    def configuration(self):
+        return self._config
+
+
+
+class ConfigTableView(_ConfigTableMixin, QTableView):
+    """ConfigTableView class
+    ConfigTableModelを用いたConfigTableWidgetのモデル/ビュー版。
+    カラム設定の形式や主要なメソッドはConfigTableWidgetと同じだが、セルごとにアイテムを作らないため
+    数十万行規模のデータを扱う場合はこちらを使う。
+    'width':'auto'を指定したカラムは、表示中の行の文字列から幅を決める（sizeHintForColumnは表示中の行のみ計測する）。
+    幅は行の追加やスクロールに合わせて広がる方向にのみ更新され、ユーザーが手動で幅を変えたカラムは以後更新しない。
+    """
+
+    #---------------------------------------------------------------------------
+    ## コンストラクタ。テーブル設定データをここで渡す。
+    # @param configuration (list) : list of dict. 詳細はConfigTableWidgetのクラスディスクリプションに記述
+    # @param parent (QWidget) : [= None]
+    # @return None
+    def __init__(self, configuration, parent = None):
+        super(ConfigTableView, self).__init__(parent)
+        self._initConfig(configuration, parent)
+        self._model = ConfigTableModel(self._config, self)
+        self.setModel(self._model)
+        self._initSettings()
+        self.setSignals()
+        self._setHeaderSetting()
+
+
+    #-------------------------------------------------------------------------
+    ## set headers。'width':'auto'のカラムがある場合は行の追加、リセットでも幅を更新する。
+    # @param None
+    # @return None
+    def _setHeaderSetting(self):
+        super(ConfigTableView, self)._setHeaderSetting()
+        if len(self._autoWidthColumns) > 0:
+            self._model.rowsInserted.connect(self._scheduleAutoWidth)
+            self._model.modelReset.connect(self._scheduleAutoWidth)
+
+
+    #-------------------------------------------------------------------------
+    ## 'width':'auto'のカラムの中身の幅を計測するメソッド(隠蔽)。sizeHintForColumnは表示中の行のみ計測する。
+    # @return widths (dict) : カラム番号と、余白を含めた中身の幅の辞書
+    def _autoWidthContentWidths(self):
+        return dict([(col, self.sizeHintForColumn(col)) for col in self._autoWidthColumns])
+
+
+    def tableModel(self):
+        return self._model
+
+
+    def addItem(self, itemData):
+        return self._model.addItem(itemData)
+
+
+    def setTypeFormatter(self, typeName, func):
+        self._model.setTypeFormatter(typeName, func)
+
+
+    def addItems(self, items):
+        return self._model.addItems(items)
+
+
+    def updateItemAt(self, row, itemData):
+        return self._model.updateItemAt(row, itemData)
+
+
+    def clearAll(self):
+        self._model.clearAll()
+
+
+    def getItemDataAt(self, row):
+        return self._model.getItemDataAt(row)
+
+
+    #---------------------------------------------------------------------------
+    ## 現在選択されている行の辞書データのリストを返す。
+    # @return itemDataList (list) : 辞書データのリスト。行順に並んでいる。
+    def selectedItemData(self):
+        return [self._model.getItemDataAt(row) for row in self.selectedRows()]
+
+
+    #-------------------------------------------------------------------------
+    ## カラムのソートをキーによって行う。昇順、降順の指定も可能
+    # @param key (str) : カラム設定のキー
+    # @param subKey (str) : カラム設定のサブキー [= None]
+    # @param order (Qt.SortOrder) : ソートタイプ [= Qt.AscendingOrder]
+    # @return None
+    def sortItemsByKey(self, key, subKey = None, order = Qt.AscendingOrder):
+        keyCol = self.getHeaderSectionByKey(key = key, subKey = subKey)
+        self.sortByColumn(keyCol, order)